@@ -25,16 +25,22 @@ def create_app():
     # 设置日志
     setup_logger()
 
-    # 提前初始化工具管理器以加载MCP服务器
-    from tools.tool_manager import ToolManager
-    ToolManager()
-
     # 注册蓝图
     app.register_blueprint(api_bp, url_prefix="/api")
 
     return app
 
 
+def create_asgi_app():
+    """创建 ASGI 应用，聊天接口以协程处理，其余接口交给 Flask
+
+    启动方式: uvicorn --factory app:create_asgi_app --host 0.0.0.0 --port 8880
+    """
+    from core.asgi_api import AsgiApp
+
+    return AsgiApp(create_app())
+
+
 if __name__ == "__main__":
     app = create_app()
     print("🚀 APOS 后端服务启动中...")
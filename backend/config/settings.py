@@ -30,6 +30,94 @@ class Config:
     # 历史记录配置
     MAX_HISTORY_LENGTH = int(os.environ.get("MAX_HISTORY_LENGTH", "100"))
 
+    # 上下文窗口配置
+    # 模型的上下文窗口大小（token），历史记录按此预算从新到旧装入，0 表示不限制
+    LLM_CONTEXT_TOKENS = int(os.environ.get("LLM_CONTEXT_TOKENS", "16000"))
+    # 为模型回复预留的 token 数，同时作为请求的 max_tokens
+    LLM_MAX_TOKENS = int(os.environ.get("LLM_MAX_TOKENS", "4000"))
+    # 缓存 token 计数的消息条数
+    TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "50000"))
+
+    # 对话摘要配置
+    # 未被摘要的历史超过该 token 数时，将较早的对话压缩为摘要，0 表示不压缩
+    SUMMARY_TRIGGER_TOKENS = int(os.environ.get("SUMMARY_TRIGGER_TOKENS", "8000"))
+    # 压缩时原样保留的最近消息 token 数
+    SUMMARY_KEEP_TOKENS = int(os.environ.get("SUMMARY_KEEP_TOKENS", "3000"))
+    # 生成摘要使用的模型，默认与对话模型相同，可配置更便宜的模型
+    SUMMARY_MODEL = os.environ.get("SUMMARY_MODEL")
+
+    # 检测到 </tool_call> 或 </final_answer> 后立即结束生成（流式请求中断连接，非流式请求传入停止序列）
+    LLM_EARLY_STOP = os.environ.get("LLM_EARLY_STOP", "True").lower() == "true"
+
+    # 工具执行配置
+    # 同一轮的多个工具调用并行执行的最大线程数
+    TOOL_MAX_WORKERS = int(os.environ.get("TOOL_MAX_WORKERS", "8"))
+    # 一轮工具调用的超时时间（秒），超时的调用单独返回错误，0 表示不限制
+    TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", "60"))
+    # 可缓存工具（计算器、时区转换、天气、文件读取等）结果缓存的条数和估算字节数上限，0 表示不缓存
+    TOOL_CACHE_MAX_ENTRIES = int(os.environ.get("TOOL_CACHE_MAX_ENTRIES", "1000"))
+    TOOL_CACHE_MAX_BYTES = int(os.environ.get("TOOL_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+    # 单个工具结果写入历史、发送给 LLM 的最大字符数，超出时只保留开头部分，完整结果存入 BLOB_DIR 供 result_reader 分页读取，0 表示不限制
+    TOOL_RESULT_MAX_CHARS = int(os.environ.get("TOOL_RESULT_MAX_CHARS", "8000"))
+    # result_reader 每页最多读取的字符数
+    TOOL_RESULT_PAGE_CHARS = int(os.environ.get("TOOL_RESULT_PAGE_CHARS", "4000"))
+
+    # MCP 会话配置
+    # stdio MCP 服务器的长连接会话空闲超过该秒数后关闭子进程，0 表示不关闭
+    MCP_IDLE_TIMEOUT = float(os.environ.get("MCP_IDLE_TIMEOUT", "300"))
+    # 每个 MCP 服务器同时执行的工具调用数上限
+    MCP_MAX_CONCURRENCY = int(os.environ.get("MCP_MAX_CONCURRENCY", "4"))
+    # 延迟启动：有缓存或声明了工具列表的 stdio 服务器不在启动时连接，首次调用其工具时才启动
+    MCP_LAZY_START = os.environ.get("MCP_LAZY_START", "True").lower() == "true"
+    # MCP 工具列表缓存文件，默认 backend/cache/mcp_tools.json
+    MCP_TOOL_CACHE_PATH = os.environ.get("MCP_TOOL_CACHE_PATH")
+
+    # 后台任务队列配置
+    # 同时执行的任务数
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+    # 排队任务数上限，超出时拒绝提交，0 表示不限制
+    JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "100"))
+    # 已结束任务的结果保留时间（秒）
+    JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "3600"))
+    # 每个任务保留的事件数上限，超出时先丢弃较早的 token 事件；任务结束后只保留非 token 事件
+    JOB_MAX_EVENTS = int(os.environ.get("JOB_MAX_EVENTS", "2000"))
+
+    # 会话持久化配置
+    # 存储后端: json (每个会话一个快照 + 追加日志) / sqlite (所有会话共享一个数据库)
+    HISTORY_BACKEND = os.environ.get("HISTORY_BACKEND", "json").lower()
+    # 会话目录，默认 backend/sessions
+    HISTORY_DIR = os.environ.get("HISTORY_DIR")
+    # SQLite 数据库路径，默认 <会话目录>/sessions.db
+    HISTORY_SQLITE_PATH = os.environ.get("HISTORY_SQLITE_PATH")
+    # 持久化模式: sync (请求线程同步写入) / batched (后台线程批量写入) / shutdown (仅退出时写入)
+    HISTORY_DURABILITY = os.environ.get("HISTORY_DURABILITY", "batched").lower()
+    # 异步对话循环中执行历史记录读写（加锁、磁盘和 SQLite I/O、分词）的线程数
+    HISTORY_IO_WORKERS = int(os.environ.get("HISTORY_IO_WORKERS", "8"))
+    # batched 模式下后台线程的写入间隔（秒）
+    HISTORY_FLUSH_INTERVAL = float(os.environ.get("HISTORY_FLUSH_INTERVAL", "0.05"))
+    # 日志同步策略: always (每次追加都 fsync) / interval (按时间间隔 fsync) / never (交给操作系统)
+    HISTORY_FSYNC = os.environ.get("HISTORY_FSYNC", "interval").lower()
+    HISTORY_FSYNC_INTERVAL = float(os.environ.get("HISTORY_FSYNC_INTERVAL", "1.0"))
+    # 会话日志累积多少条记录后压缩为快照
+    HISTORY_COMPACT_THRESHOLD = int(os.environ.get("HISTORY_COMPACT_THRESHOLD", "200"))
+    # JSON 后端会话元数据索引的最小保存间隔（秒）
+    HISTORY_INDEX_SAVE_INTERVAL = float(os.environ.get("HISTORY_INDEX_SAVE_INTERVAL", "1.0"))
+    # 内存中缓存的会话总消息数和估算字节数上限，超过后淘汰最久未使用的会话
+    HISTORY_CACHE_MAX_MESSAGES = int(os.environ.get("HISTORY_CACHE_MAX_MESSAGES", "20000"))
+    HISTORY_CACHE_MAX_BYTES = int(os.environ.get("HISTORY_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+    # 冷会话归档（仅 JSON 后端）：空闲超过该秒数的会话压缩移入 sessions/archive，0 表示不归档
+    HISTORY_ARCHIVE_AFTER = float(os.environ.get("HISTORY_ARCHIVE_AFTER", str(7 * 24 * 3600)))
+    # 检查空闲会话的间隔（秒）
+    HISTORY_ARCHIVE_INTERVAL = float(os.environ.get("HISTORY_ARCHIVE_INTERVAL", "3600"))
+    # 单个归档包的大小上限（字节），超过后写入新的归档包
+    HISTORY_ARCHIVE_BUNDLE_MAX_BYTES = int(os.environ.get("HISTORY_ARCHIVE_BUNDLE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    # 多模态图片存储配置
+    # 图片按内容哈希保存的目录，默认 backend/blobs
+    BLOB_DIR = os.environ.get("BLOB_DIR")
+    # 超过该长度（字节）的 data URI 图片移入存储，历史记录只保留引用
+    BLOB_INLINE_MAX_BYTES = int(os.environ.get("BLOB_INLINE_MAX_BYTES", "4096"))
+
     @classmethod
     def validate_config(cls):
         """验证配置"""
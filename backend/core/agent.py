@@ -6,12 +6,18 @@ APOS Agent 核心模块
 
 import json
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, AsyncIterator, Tuple
 from core.llm_client import LLMClient
 from core.history_manager import HistoryManager
+from core.session_locks import AsyncSessionLocks
+from core.stream_parser import TagStreamParser, STOP_SEQUENCES, complete_stopped
+from core.token_counter import MESSAGE_OVERHEAD, REPLY_OVERHEAD
+from core.summarizer import ConversationSummarizer, split_summarized
+from config.settings import Config
 from tools.tool_manager import ToolManager
+from utils.async_runner import runner
 from utils.logger import get_logger
-from .prompts import get_system_prompt
+from .prompts import get_system_prompt, get_runtime_prompt
 import platform
 import getpass
 from datetime import datetime
@@ -24,18 +30,82 @@ class APOSAgent:
         self.llm_client = LLMClient()
         self.history_manager = HistoryManager()
         self.tool_manager = ToolManager()
+        # 长会话的较早部分压缩为摘要后再发送给 LLM
+        self.summarizer = ConversationSummarizer(self.llm_client, self.history_manager)
         self.session_iterations = {}
+        # 同一会话的对话循环依次执行，不同会话并行；对话循环运行在共享事件循环中
+        self.session_locks = AsyncSessionLocks()
+        # 系统信息在进程内不变，只获取一次
+        self.system_info = {
+            'system_version': platform.version(),
+            'username': getpass.getuser()
+        }
+        # 系统提示词静态部分的缓存: (工具注册表版本, 文本)
+        self._prompt_cache = None
         
         self.logger.info("🤖 APOS Agent 初始化完成")
     
-    def process_message(self, user_message: str, session_id: str = 'default') -> Dict[str, Any]:
-        """处理用户消息"""
+    def process_message(self, user_message: str, session_id: str = 'default',
+                        images: List[str] = None) -> Dict[str, Any]:
+        """处理用户消息，images 为可选的图片 URL 或 data URI 列表"""
+        return runner.run(self.aprocess_message(user_message, session_id, images))
+    
+    def stream_message(self, user_message: str, session_id: str = 'default',
+                       images: List[str] = None) -> Iterator[Dict[str, Any]]:
+        """流式处理用户消息，逐个产出迭代、LLM 文本片段、工具调用、工具结果和最终结果事件"""
+        yield from runner.iterate(self.astream_message(user_message, session_id, images))
+    
+    def confirm_tool_calls(self, session_id: str, tool_calls: List[Dict[str, Any]],
+                           allow: bool) -> Dict[str, Any]:
+        """处理用户对待确认工具调用的决定，然后继续对话"""
+        return runner.run(self.aconfirm_tool_calls(session_id, tool_calls, allow))
+    
+    async def aprocess_message(self, user_message: str, session_id: str = 'default',
+                               images: List[str] = None) -> Dict[str, Any]:
+        """process_message 的异步版本"""
+        async with self.session_locks.hold(session_id):
+            return await self._aprocess(user_message, session_id, images)
+    
+    async def astream_message(self, user_message: str, session_id: str = 'default',
+                              images: List[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """stream_message 的异步版本"""
+        async with self.session_locks.hold(session_id):
+            async for event in self._arun(user_message, session_id, images, stream=True):
+                yield event
+    
+    async def aconfirm_tool_calls(self, session_id: str, tool_calls: List[Dict[str, Any]],
+                                  allow: bool) -> Dict[str, Any]:
+        """confirm_tool_calls 的异步版本，工具执行与后续对话在同一次会话锁内完成"""
+        async with self.session_locks.hold(session_id):
+            if allow:
+                await self._aexecute_tool_calls(session_id, tool_calls)
+            else:
+                # 用户拒绝，添加拒绝信息到历史
+                tool_names = ', '.join(tool_call['tool'] for tool_call in tool_calls)
+                await self.history_manager.aadd_message(session_id, 'system', f"用户拒绝调用工具: {tool_names}")
+            
+            # 传入空消息继续处理
+            return await self._aprocess('', session_id, None)
+    
+    async def _aprocess(self, user_message: str, session_id: str, images: List[str]) -> Dict[str, Any]:
+        """执行对话循环并返回最终结果，调用方需持有会话锁"""
+        async for event in self._arun(user_message, session_id, images, stream=False):
+            if event['type'] == 'done':
+                return {key: value for key, value in event.items() if key != 'type'}
+    
+    async def _arun(self, user_message: str, session_id: str, images: List[str],
+                    stream: bool) -> AsyncIterator[Dict[str, Any]]:
+        """对话循环，以事件形式产出进度，最后一个事件总是 done"""
         self.logger.info(f"🔄 开始处理消息 - 会话: {session_id}")
         
         try:
             # 添加用户消息到历史记录
-            if user_message and user_message.strip():
-                self.history_manager.add_message(session_id, 'user', user_message)
+            is_new_message = bool(images) or bool(user_message and user_message.strip())
+            if images:
+                content = self.llm_client.create_multimodal_content(user_message, images)
+                await self.history_manager.aadd_message(session_id, 'user', content)
+            elif is_new_message:
+                await self.history_manager.aadd_message(session_id, 'user', user_message)
             
             # 构建系统提示词
             system_prompt = self._build_system_prompt()
@@ -43,24 +113,39 @@ class APOSAgent:
             # 开始对话循环
             max_iterations = 20  # 最大迭代次数
             # 初始化迭代次数 - 新消息重置计数，工具确认继续计数
-            if user_message and user_message.strip():
+            if is_new_message:
                 self.session_iterations[session_id] = 0
             iteration = self.session_iterations.get(session_id, 0)
             final_response = None
+            # 每次迭代发送给 LLM 的提示词 token 数（本地估算）
+            prompt_tokens = []
             
             while iteration < max_iterations:
                 iteration += 1
                 self.session_iterations[session_id] = iteration
                 self.logger.info(f"🔄 第 {iteration} 次迭代")
                 
-                # 获取历史记录
-                history = self.history_manager.get_history(session_id)
+                # 未摘要的历史过长时先压缩较早的部分
+                summary = await self.summarizer.acompact(session_id)
+                if summary:
+                    yield {'type': 'summary', 'summary_upto': summary['summary_upto']}
+                
+                # 获取历史记录，按 token 预算选取本次发送的部分（读取和分词在历史记录线程池中执行）
+                history, tokens = await self.history_manager.arun(self._build_context, session_id, system_prompt)
+                prompt_tokens.append(tokens)
+                yield {'type': 'iteration', 'iteration': iteration, 'prompt_tokens': tokens}
                 
-                # 调用 LLM
-                response = self.llm_client.chat(system_prompt, history)
+                # 调用 LLM，流式模式下边生成边产出文本片段
+                if stream:
+                    chunks = []
+                    async for event in self._astream_response(system_prompt, history, chunks):
+                        yield event
+                    response = ''.join(chunks)
+                else:
+                    response = await self._acomplete_response(system_prompt, history)
                 
                 # 添加助手响应到历史记录
-                self.history_manager.add_message(session_id, 'assistant', response)
+                await self.history_manager.aadd_message(session_id, 'assistant', response)
                 
                 # 检查是否任务完成
                 if self._is_task_completed(response):
@@ -68,53 +153,51 @@ class APOSAgent:
                     final_response = self._extract_final_answer(response)
                     break
                 
-                # 检查是否需要调用工具
-                tool_call = self._extract_tool_call(response)
+                # 检查是否需要调用工具，一次响应可以包含多个相互独立的工具调用
+                tool_calls = self._extract_tool_calls(response)
                 
-                if tool_call:
-                    self.logger.info(f"🔧 检测到工具调用: {tool_call['tool']}")
+                if tool_calls:
+                    self.logger.info(f"🔧 检测到工具调用: {', '.join(call['tool'] for call in tool_calls)}")
+                    for tool_call in tool_calls:
+                        yield {'type': 'tool_call', 'tool_call': tool_call}
                     
-                    # 检查是否是MCP工具
-                    # 检查是否是MCP工具
-                    is_mcp_tool = tool_call['tool'].startswith('mcp_') or hasattr(self.tool_manager.tools[tool_call['tool']], 'is_mcp')
-
-                    if is_mcp_tool:
-                        # 需要用户确认，将工具调用请求存储到会话状态
-                        self.history_manager.add_message(
+                    # MCP 工具需要用户确认，其余工具直接并行执行
+                    pending = [call for call in tool_calls if self._is_mcp_tool(call['tool'])]
+                    ready = [call for call in tool_calls if not self._is_mcp_tool(call['tool'])]
+                    
+                    if ready:
+                        tool_results = await self._aexecute_tool_calls(session_id, ready)
+                        for tool_call, tool_result in zip(ready, tool_results):
+                            yield {'type': 'tool_result', 'tool': tool_call['tool'], 'result': tool_result}
+                    
+                    if pending:
+                        # 将待确认的工具调用请求存储到会话状态
+                        await self.history_manager.aadd_message(
                             session_id, 
                             'system', 
                             json.dumps({
                                 'type': 'tool_confirmation_required',
-                                'tool': tool_call['tool'],
-                                'parameters': tool_call['parameters']
+                                'tool': pending[0]['tool'],
+                                'parameters': pending[0]['parameters'],
+                                'tool_calls': pending
                             }, ensure_ascii=False)
                         )
-
+                        
                         # 返回需要确认的状态
-                        return {
+                        yield {
+                            'type': 'done',
                             'response': '需要用户确认工具调用',
                             'session_id': session_id,
                             'status': 'waiting_for_confirmation',
-                            'tool_call': tool_call
+                            'tool_call': pending[0],
+                            'tool_calls': pending,
+                            'prompt_tokens': prompt_tokens
                         }
-
-                else:
-                    # 非MCP工具直接执行
-                    tool_result = self.tool_manager.execute_tool(
-                        tool_call['tool'], 
-                        tool_call['parameters']
-                    )
-
-                    # 添加工具结果到历史记录
-                    self.history_manager.add_message(
-                        session_id, 
-                        'system', 
-                        f"工具执行结果: {json.dumps(tool_result, ensure_ascii=False)}"
-                    )
-
+                        return
+                    
                     # 继续下一次迭代
                     continue
-
+                
                 # 如果没有工具调用，也没有最终答案，则直接跳出
                 self.logger.warning("🤔 未检测到工具调用或最终答案，提前结束任务。")
                 final_response = response # 将当前响应作为最终响应
@@ -123,53 +206,138 @@ class APOSAgent:
             # 如果循环结束后没有最终响应，则获取最后一条助手消息
             if final_response is None:
                 self.logger.warning("🤔 达到最大迭代次数，但未找到最终答案。")
-                final_response = self.history_manager.get_last_assistant_message(session_id)
+                final_response = await self.history_manager.aget_last_assistant_message(session_id)
             
             # 任务完成，重置迭代计数
             self.session_iterations[session_id] = 0
-            return {
+            yield {
+                'type': 'done',
                 'response': final_response,
                 'session_id': session_id,
                 'iterations': iteration,
+                'prompt_tokens': prompt_tokens,
                 'status': 'completed' if final_response and iteration < max_iterations else 'max_iterations_reached'
             }
             
         except Exception as e:
             self.logger.error(f"❌ 处理消息错误: {str(e)}")
-            return {
+            yield {
+                'type': 'done',
                 'error': str(e),
                 'session_id': session_id,
                 'status': 'error'
             }
     
+    async def _astream_response(self, system_prompt: str, history: List[Dict[str, Any]],
+                                chunks: List[str]) -> AsyncIterator[Dict[str, Any]]:
+        """流式调用 LLM 并产出文本片段，标签闭合后立即中断生成，保留的文本追加到 chunks"""
+        parser = TagStreamParser() if Config.LLM_EARLY_STOP else None
+        deltas = self.llm_client.achat_stream(system_prompt, history)
+        try:
+            async for delta in deltas:
+                if parser:
+                    delta = parser.feed(delta)
+                if delta:
+                    chunks.append(delta)
+                    yield {'type': 'token', 'content': delta}
+                if parser and parser.closed:
+                    self.logger.info(f"✂️ 检测到 </{parser.closed}>，提前结束生成")
+                    break
+        finally:
+            await deltas.aclose()
+        
+        # 生成正常结束时，返回工具调用之后暂存的内容
+        tail = parser.finish() if parser else ''
+        if tail:
+            chunks.append(tail)
+            yield {'type': 'token', 'content': tail}
+    
+    async def _acomplete_response(self, system_prompt: str, history: List[Dict[str, Any]]) -> str:
+        """非流式调用 LLM，通过停止序列在标签闭合处结束生成"""
+        if not Config.LLM_EARLY_STOP:
+            return await self.llm_client.achat(system_prompt, history)
+        
+        response = await self.llm_client.achat(system_prompt, history, stop=STOP_SEQUENCES)
+        # 停止序列本身不出现在响应中，补全闭合标签；不支持停止序列的服务在此截断多余内容
+        parser = TagStreamParser()
+        parser.feed(complete_stopped(response))
+        parser.finish()
+        return parser.text
+    
     def _build_system_prompt(self) -> str:
-        """构建系统提示词"""
-        system_info = {
-            'system_version': platform.version(),
-            'username': getpass.getuser(),
-            'current_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        tools_info = self.tool_manager.get_tools_description()
+        """构建系统提示词，静态部分在工具注册表变化前一直复用"""
+        cache = self._prompt_cache
+        version = self.tool_manager.version
+        if cache is None or cache[0] != version:
+            tools_info = self.tool_manager.get_tools_description()
+            cache = self._prompt_cache = (version, get_system_prompt(tools_info, self.system_info))
+        
+        # 当前时间放在末尾；一次对话的多轮迭代共用同一份提示词，前缀保持不变
+        return cache[1] + get_runtime_prompt(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    
+    def _build_context(self, session_id: str, system_prompt: str) -> Tuple[List[Dict[str, Any]], int]:
+        """按 token 预算选取发送给 LLM 的历史消息，返回 (消息列表, 提示词 token 数)
+
+        已被摘要的消息只以摘要的形式发送，摘要始终位于最前面。
+        """
+        summary, history = split_summarized(self.history_manager.get_history(session_id))
+        counter = self.llm_client.tokens
+        fixed = counter.count_text(system_prompt) + MESSAGE_OVERHEAD + REPLY_OVERHEAD
+        if summary:
+            fixed += counter.count_message(summary, (session_id, summary['seq'], summary.get('timestamp')))
+        
+        # 预算 = 上下文窗口 - 回复预留 - 系统提示词和摘要
+        if Config.LLM_CONTEXT_TOKENS > 0:
+            budget = Config.LLM_CONTEXT_TOKENS - self.llm_client.max_tokens - fixed
+        else:
+            budget = float('inf')
         
-        return get_system_prompt(tools_info, system_info)
+        # 消息写入后不再变化，计数按会话、序号和时间戳缓存
+        keys = [(session_id, message['seq'], message.get('timestamp')) for message in history]
+        context, used = counter.fit(history, budget, keys)
+        
+        if len(context) < len(history):
+            self.logger.info(f"📏 上下文超出预算，发送 {len(context)}/{len(history)} 条消息")
+        self.logger.info(f"📏 提示词 token 数: {fixed + used}")
+        return ([summary] if summary else []) + context, fixed + used
     
-    def _extract_tool_call(self, response: str) -> Dict[str, Any]:
-        """从响应中提取工具调用"""
+    def _extract_tool_calls(self, response: str) -> List[Dict[str, Any]]:
+        """从响应中按顺序提取所有工具调用"""
         # 使用正则表达式匹配 XML 格式的工具调用
         pattern = r'<tool_call>\s*(\{.*?\})\s*</tool_call>'
-        match = re.search(pattern, response, re.DOTALL)
+        tool_calls = []
         
-        if match:
+        for match in re.finditer(pattern, response, re.DOTALL):
             try:
-                tool_call_json = match.group(1)
-                tool_call = json.loads(tool_call_json)
-                self.logger.info(f"🔍 提取到工具调用: {tool_call}")
-                return tool_call
+                tool_call = json.loads(match.group(1))
             except json.JSONDecodeError as e:
                 self.logger.error(f"❌ 工具调用 JSON 解析错误: {e}")
-                return None
+                continue
+            
+            if not isinstance(tool_call, dict) or 'tool' not in tool_call:
+                self.logger.error(f"❌ 工具调用缺少 tool 字段: {tool_call}")
+                continue
+            tool_call.setdefault('parameters', {})
+            self.logger.info(f"🔍 提取到工具调用: {tool_call}")
+            tool_calls.append(tool_call)
         
-        return None
+        return tool_calls
+    
+    def _is_mcp_tool(self, tool_name: str) -> bool:
+        """MCP 工具执行前需要用户确认"""
+        tool = self.tool_manager.tools.get(tool_name)
+        return tool_name.startswith('mcp_') or hasattr(tool, 'is_mcp')
+    
+    async def _aexecute_tool_calls(self, session_id: str, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """并行执行一轮工具调用，并将全部结果作为一条消息写入历史记录"""
+        tool_results = await self.tool_manager.aexecute_tools(tool_calls)
+        
+        if len(tool_results) == 1:
+            content = f"工具执行结果: {json.dumps(tool_results[0], ensure_ascii=False)}"
+        else:
+            content = f"工具执行结果（按调用顺序）: {json.dumps(tool_results, ensure_ascii=False)}"
+        await self.history_manager.aadd_message(session_id, 'system', content)
+        return tool_results
 
     def _extract_final_answer(self, response: str) -> str:
         """从响应中提取最终答案"""
@@ -198,7 +366,13 @@ class APOSAgent:
     
     def clear_history(self, session_id: str):
         """清除历史记录"""
-        self.history_manager.clear_history(session_id)
+        runner.run(self.aclear_history(session_id))
+    
+    async def aclear_history(self, session_id: str):
+        """clear_history 的异步版本，等待会话中正在进行的对话结束后清除"""
+        async with self.session_locks.hold(session_id):
+            await self.history_manager.arun(self.history_manager.clear_history, session_id)
+            self.session_iterations.pop(session_id, None)
     
     def get_available_tools(self) -> List[Dict[str, Any]]:
         """获取可用工具列表"""
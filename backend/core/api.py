@@ -4,8 +4,12 @@
 APOS API 路由
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, make_response
 from core.agent import APOSAgent
+from core.blob_store import guess_mime_type
+from core.job_queue import JobQueue, JobQueueFull
+from tools.mcp_modules.mcp_pool import session_pool
+from config.settings import Config
 from utils.logger import get_logger
 import traceback
 import json
@@ -19,6 +23,15 @@ logger = get_logger(__name__)
 # 创建 Agent 实例
 agent = APOSAgent()
 
+# 后台任务队列
+job_queue = JobQueue(
+    agent,
+    workers=Config.JOB_WORKERS,
+    max_queued=Config.JOB_QUEUE_MAX,
+    result_ttl=Config.JOB_RESULT_TTL,
+    max_events=Config.JOB_MAX_EVENTS
+)
+
 @api_bp.route('/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
@@ -29,27 +42,43 @@ def health_check():
         'version': '1.0.0'
     })
 
+def parse_chat_payload(data):
+    """校验聊天请求体，返回 (用户消息, 会话ID, 图片列表, 错误信息)"""
+    if not isinstance(data, dict) or 'message' not in data:
+        return None, None, None, '请求数据格式错误，需要包含 message 字段'
+    
+    # 可选的图片列表（URL 或 base64 data URI），不写入日志
+    images = data.get('images') or []
+    if not isinstance(images, list) or not all(isinstance(image, str) for image in images):
+        return None, None, None, 'images 字段必须是字符串列表'
+    
+    return data['message'], data.get('session_id', 'default'), images, None
+
+def _parse_chat_request():
+    """解析聊天请求，返回 (用户消息, 会话ID, 图片列表, 错误响应)"""
+    user_message, session_id, images, error = parse_chat_payload(request.get_json())
+    if error:
+        return None, None, None, (jsonify({'error': error}), 400)
+    return user_message, session_id, images, None
+
+def format_sse(event):
+    """将 Agent 事件编码为 Server-Sent Events 格式"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
 @api_bp.route('/chat', methods=['POST'])
 def chat():
     """聊天接口"""
     try:
-        data = request.get_json()
-        logger.info(f"💬 收到聊天请求: {data}")
-        
-        if not data or 'message' not in data:
-            return jsonify({
-                'error': '请求数据格式错误，需要包含 message 字段'
-            }), 400
-        
-        # 获取用户消息
-        user_message = data['message']
-        session_id = data.get('session_id', 'default')
+        user_message, session_id, images, error = _parse_chat_request()
+        if error:
+            return error
         
+        logger.info(f"💬 收到聊天请求 - 图片数量: {len(images)}")
         logger.info(f"👤 用户消息: {user_message}")
         logger.info(f"🔑 会话ID: {session_id}")
         
         # 调用 Agent 处理
-        response = agent.process_message(user_message, session_id)
+        response = agent.process_message(user_message, session_id, images)
         
         logger.info(f"🤖 Agent 响应: {response}")
         
@@ -62,20 +91,142 @@ def chat():
             'error': f'服务器内部错误: {str(e)}'
         }), 500
 
+@api_bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """流式聊天接口，以 Server-Sent Events 推送生成过程"""
+    try:
+        user_message, session_id, images, error = _parse_chat_request()
+        if error:
+            return error
+        
+        logger.info(f"💬 收到流式聊天请求 - 会话ID: {session_id}, 图片数量: {len(images)}")
+        logger.info(f"👤 用户消息: {user_message}")
+        
+        def generate():
+            for event in agent.stream_message(user_message, session_id, images):
+                yield format_sse(event)
+        
+        # 禁止代理缓冲，保证文本片段即时送达
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ 流式聊天接口错误: {str(e)}")
+        logger.error(f"📋 错误详情: {traceback.format_exc()}")
+        return jsonify({
+            'error': f'服务器内部错误: {str(e)}'
+        }), 500
+
+@api_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """提交后台对话任务，立即返回任务ID"""
+    try:
+        user_message, session_id, images, error = _parse_chat_request()
+        if error:
+            return error
+        
+        job = job_queue.submit(session_id, user_message, images)
+        return jsonify({
+            'success': True,
+            'job': job.to_dict()
+        }), 202
+        
+    except JobQueueFull as e:
+        logger.warning(f"⚠️ 任务队列已满: {str(e)}")
+        return jsonify({
+            'error': str(e)
+        }), 429, {'Retry-After': '5'}
+        
+    except Exception as e:
+        logger.error(f"❌ 提交任务错误: {str(e)}")
+        return jsonify({
+            'error': f'提交任务失败: {str(e)}'
+        }), 500
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态和结果"""
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({
+                'error': f'任务不存在或已过期: {job_id}'
+            }), 404
+        return jsonify({
+            'success': True,
+            'job': job
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ 查询任务错误: {str(e)}")
+        return jsonify({
+            'error': f'查询任务失败: {str(e)}'
+        }), 500
+
+@api_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """以 Server-Sent Events 推送任务事件，断线后可通过 Last-Event-ID 或 since 参数续读"""
+    try:
+        if job_queue.get(job_id) is None:
+            return jsonify({
+                'error': f'任务不存在或已过期: {job_id}'
+            }), 404
+        
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        since = last_event_id + 1 if last_event_id is not None else request.args.get('since', 0, type=int)
+        
+        def generate():
+            for index, event in job_queue.iter_events(job_id, since):
+                if event is None:
+                    # 心跳，避免代理因长时间无数据断开连接
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"id: {index}\n{format_sse(event)}"
+        
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ 任务事件流错误: {str(e)}")
+        return jsonify({
+            'error': f'获取任务事件失败: {str(e)}'
+        }), 500
+
 @api_bp.route('/history/<session_id>', methods=['GET'])
 def get_history(session_id):
-    """获取历史记录接口"""
+    """获取历史记录接口，支持 since_seq 增量拉取"""
     try:
-        logger.info(f"📚 获取历史记录请求: {session_id}")
+        since_seq = request.args.get('since_seq', 0, type=int)
+        limit = request.args.get('limit', type=int)
+        logger.info(f"📚 获取历史记录请求: {session_id}, since_seq: {since_seq}")
         
-        history = agent.get_history(session_id)
+        if since_seq < 0 or (limit is not None and limit <= 0):
+            return jsonify({
+                'error': 'since_seq 或 limit 参数错误'
+            }), 400
         
-        logger.info(f"📖 返回历史记录数量: {len(history)}")
+        page = agent.history_manager.get_history_since(session_id, since_seq, limit)
         
-        return jsonify({
+        # 会话未变化时返回 304，客户端轮询无需重新下载
+        etag = f"{page['last_seq']}-{page['message_count']}"
+        if request.if_none_match.contains(etag):
+            return '', 304, {'ETag': f'"{etag}"'}
+        
+        logger.info(f"📖 返回历史记录数量: {len(page['messages'])}")
+        
+        response = jsonify({
             'session_id': session_id,
-            'history': history
+            'history': page['messages'],
+            'last_seq': page['last_seq'],
+            'next_seq': page['next_seq'],
+            'has_more': page['has_more']
         })
+        response.set_etag(etag)
+        return response
         
     except Exception as e:
         logger.error(f"❌ 获取历史记录错误: {str(e)}")
@@ -83,6 +234,29 @@ def get_history(session_id):
             'error': f'获取历史记录失败: {str(e)}'
         }), 500
 
+@api_bp.route('/blobs/<digest>', methods=['GET'])
+def get_blob(digest):
+    """获取历史记录中引用的图片内容"""
+    try:
+        data = agent.history_manager.blobs.get(digest)
+        if data is None:
+            return jsonify({
+                'error': f'内容不存在: {digest}'
+            }), 404
+        
+        # 内容按哈希寻址，永不变化，可长期缓存
+        response = make_response(data)
+        response.headers['Content-Type'] = guess_mime_type(data)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.set_etag(digest)
+        return response
+        
+    except Exception as e:
+        logger.error(f"❌ 获取图片内容错误: {str(e)}")
+        return jsonify({
+            'error': f'获取图片内容失败: {str(e)}'
+        }), 500
+
 @api_bp.route('/clear/<session_id>', methods=['DELETE'])
 def clear_history(session_id):
     """清除历史记录接口"""
@@ -105,26 +279,62 @@ def clear_history(session_id):
 
 @api_bp.route('/sessions', methods=['GET'])
 def list_sessions():
-    """列出所有会话"""
+    """列出所有会话，支持排序和分页"""
     try:
         logger.info("📋 获取会话列表请求")
         
-        session_ids = agent.history_manager.get_all_sessions()
-        sessions = []
-        for session_id in session_ids:
-            info = agent.history_manager.get_session_info(session_id)
-            sessions.append(info)
+        sort_by = request.args.get('sort', 'last_updated')
+        order = request.args.get('order', 'desc')
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', type=int)
+        
+        if order not in ('asc', 'desc') or offset < 0 or (limit is not None and limit < 0):
+            return jsonify({
+                'error': '分页或排序参数错误'
+            }), 400
+        
+        sessions, total = agent.history_manager.list_sessions(sort_by, order, offset, limit)
         
         return jsonify({
-            'sessions': sessions
+            'sessions': sessions,
+            'total': total,
+            'offset': offset,
+            'limit': limit
         })
         
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+        
     except Exception as e:
         logger.error(f"❌ 获取会话列表错误: {str(e)}")
         return jsonify({
             'error': f'获取会话列表失败: {str(e)}'
         }), 500
 
+@api_bp.route('/stats', methods=['GET'])
+def get_stats():
+    """获取运行时缓存统计"""
+    try:
+        logger.info("📊 获取运行统计请求")
+        
+        return jsonify({
+            'history_cache': agent.history_manager.get_cache_stats(),
+            'history_archive': agent.history_manager.get_archive_stats(),
+            'token_counter': agent.llm_client.tokens.get_stats(),
+            'tool_cache': agent.tool_manager.result_cache.get_stats(),
+            'mcp_servers': agent.tool_manager.mcp_loader.get_server_status(),
+            'mcp_sessions': session_pool.get_stats(),
+            'jobs': job_queue.get_stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ 获取运行统计错误: {str(e)}")
+        return jsonify({
+            'error': f'获取运行统计失败: {str(e)}'
+        }), 500
+
 @api_bp.route('/sessions', methods=['POST'])
 def create_session():
     """创建新会话"""
@@ -182,44 +392,44 @@ def get_tools():
             'error': f'获取工具列表失败: {str(e)}'
         }), 500
 
+@api_bp.route('/tools/cache', methods=['DELETE'])
+def clear_tool_cache():
+    """清除工具结果缓存，可用查询参数 tool 指定工具"""
+    try:
+        tool_name = request.args.get('tool')
+        logger.info(f"🧹 清除工具结果缓存请求 - 工具: {tool_name or '全部'}")
+
+        count = agent.tool_manager.invalidate_cache(tool_name)
+
+        return jsonify({
+            'success': True,
+            'cleared': count
+        })
+
+    except Exception as e:
+        logger.error(f"❌ 清除工具结果缓存错误: {str(e)}")
+        return jsonify({
+            'error': f'清除工具结果缓存失败: {str(e)}'
+        }), 500
+
 @api_bp.route('/confirm-tool', methods=['POST'])
 def confirm_tool():
     """处理用户对工具调用的确认"""
     try:
         data = request.get_json()
         session_id = data.get('session_id', 'default')
-        tool_call = data.get('tool_call')
+        # 同一轮可能有多个工具调用等待确认，兼容只传单个 tool_call 的客户端
+        tool_calls = data.get('tool_calls') or ([data['tool_call']] if data.get('tool_call') else [])
         decision = data.get('decision')  # 'allow' 或 'deny'
         
-        if not tool_call or not decision:
+        if not tool_calls or not decision:
             return jsonify({'error': '缺少tool_call或decision参数'}), 400
         
-        logger.info(f"📋 用户确认工具调用: {decision} - {tool_call['tool']}")
-        
-        if decision == 'allow':
-            # 执行工具
-            tool_result = agent.tool_manager.execute_tool(
-                tool_call['tool'],
-                tool_call['parameters']
-            )
-            
-            # 添加工具结果到历史
-            agent.history_manager.add_message(
-                session_id,
-                'system',
-                f"工具执行结果: {json.dumps(tool_result, ensure_ascii=False)}"
-            )
-        else:
-            # 用户拒绝，添加拒绝信息到历史
-            agent.history_manager.add_message(
-                session_id,
-                'system',
-                f"用户拒绝调用工具: {tool_call['tool']}"
-            )
-            tool_result = {'success': False, 'error': '用户拒绝调用工具'}
-        
-        # 继续处理对话
-        response = agent.process_message('', session_id)  # 传入空消息继续处理
+        tool_names = ', '.join(tool_call['tool'] for tool_call in tool_calls)
+        logger.info(f"📋 用户确认工具调用: {decision} - {tool_names}")
+        
+        # 工具执行与后续对话在会话锁内完成，避免与同一会话的其他请求交错
+        response = agent.confirm_tool_calls(session_id, tool_calls, decision == 'allow')
         return jsonify(response)
         
     except Exception as e:
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS ASGI 接口
+
+聊天接口直接以协程处理：等待 LLM 和工具时不占用线程，一个进程可以同时承载大量对话。
+其余接口数量多但耗时短，经 WsgiToAsgi 交给 Flask 蓝图处理，行为与 WSGI 部署完全一致。
+"""
+
+import asyncio
+import json
+import traceback
+from asgiref.wsgi import WsgiToAsgi
+from core.api import agent, parse_chat_payload, format_sse
+from utils.async_runner import runner
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 由协程直接处理的接口：路径 -> 是否流式
+NATIVE_ROUTES = {
+    '/api/chat': False,
+    '/api/chat/stream': True,
+}
+
+# 与 Flask-CORS 的 origins="*" 保持一致
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+class AsgiApp:
+    """ASGI 应用入口"""
+
+    def __init__(self, flask_app):
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] in NATIVE_ROUTES:
+            await self._chat(receive, send, NATIVE_ROUTES[scope['path']])
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        """应用启动和退出；会话数据由 HistoryManager 在进程退出时写入"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _chat(self, receive, send, stream: bool):
+        """处理聊天请求，Agent 在共享事件循环中运行"""
+        try:
+            data = json.loads(await self._read_body(receive))
+        except ValueError:
+            data = None
+
+        user_message, session_id, images, error = parse_chat_payload(data)
+        if error:
+            await self._send_json(send, 400, {'error': error})
+            return
+
+        logger.info(f"💬 收到{'流式' if stream else ''}聊天请求 - 会话ID: {session_id}, 图片数量: {len(images)}")
+        logger.info(f"👤 用户消息: {user_message}")
+
+        if stream:
+            await self._stream_chat(receive, send, user_message, session_id, images)
+            return
+
+        try:
+            response = await runner.submit(agent.aprocess_message(user_message, session_id, images))
+            logger.info(f"🤖 Agent 响应: {response}")
+            await self._send_json(send, 200, response)
+        except Exception as e:
+            logger.error(f"❌ 聊天接口错误: {str(e)}")
+            logger.error(f"📋 错误详情: {traceback.format_exc()}")
+            await self._send_json(send, 500, {'error': f'服务器内部错误: {str(e)}'})
+
+    async def _stream_chat(self, receive, send, user_message, session_id, images):
+        """以 Server-Sent Events 推送生成过程，客户端断开后立即停止 Agent"""
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ] + CORS_HEADERS
+        })
+
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        events = runner.relay(agent.astream_message(user_message, session_id, images))
+        try:
+            async for event in events:
+                if disconnected.done():
+                    logger.info(f"🔌 客户端已断开，停止处理 - 会话ID: {session_id}")
+                    return
+                await send({
+                    'type': 'http.response.body',
+                    'body': format_sse(event).encode('utf-8'),
+                    'more_body': True
+                })
+            await send({'type': 'http.response.body', 'body': b''})
+        except Exception as e:
+            logger.error(f"❌ 流式聊天接口错误: {str(e)}")
+            logger.error(f"📋 错误详情: {traceback.format_exc()}")
+        finally:
+            disconnected.cancel()
+            await events.aclose()
+
+    async def _read_body(self, receive) -> bytes:
+        """读取完整的请求体"""
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return body
+
+    async def _wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def _send_json(self, send, status: int, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ] + CORS_HEADERS
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 内容寻址二进制存储模块
+
+多模态消息中的 base64 图片按 SHA-256 存放在 blobs/<前两位>/<哈希> 下，
+相同内容只保存一份。历史记录中只保留 blob:sha256:<哈希> 引用，
+在组装 LLM 请求时再还原为 data URI。
+"""
+
+from typing import Any, Optional
+from collections import OrderedDict
+import os
+import re
+import base64
+import hashlib
+import binascii
+import threading
+from config.settings import Config
+from utils.logger import get_logger
+
+BLOB_SCHEME = 'blob:sha256:'
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+DATA_URI_PATTERN = re.compile(r'^data:([\w.+-]+/[\w.+-]+)?;base64,(.*)$', re.DOTALL)
+
+# 常见图片格式的文件头
+MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+
+def guess_mime_type(data: bytes) -> str:
+    """根据文件头猜测二进制内容的类型"""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    for magic, mime_type in MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime_type
+    return 'application/octet-stream'
+
+
+class BlobStore:
+    """按内容哈希去重的二进制存储"""
+
+    def __init__(self, blob_dir: Optional[str] = None, inline_max_bytes: Optional[int] = None,
+                 cache_size: int = 32):
+        self.logger = get_logger(__name__)
+        self.blob_dir = blob_dir or Config.BLOB_DIR or os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), 'blobs'
+        )
+        self.inline_max_bytes = Config.BLOB_INLINE_MAX_BYTES if inline_max_bytes is None else inline_max_bytes
+
+        # 同一张图片在一次对话的多轮迭代中会被反复发送，缓存编码结果
+        self._cache: 'OrderedDict[str, str]' = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        """获取哈希对应的文件路径"""
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        """二进制内容是否存在"""
+        return bool(DIGEST_PATTERN.match(digest)) and os.path.exists(self.path(digest))
+
+    def put(self, data: bytes) -> str:
+        """保存二进制内容并返回哈希，已存在时直接复用"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，并发写入同一内容时结果一致
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.logger.info(f"💾 保存二进制内容: {digest}, 大小: {len(data)}")
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """读取二进制内容，不存在时返回 None"""
+        if not self.exists(digest):
+            return None
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    def externalize(self, content: Any) -> Any:
+        """将多模态内容中较大的 data URI 图片替换为引用"""
+        if not isinstance(content, list):
+            return content
+        return [self._externalize_part(part) for part in content]
+
+    def _externalize_part(self, part: Any) -> Any:
+        image_url = part.get('image_url') if isinstance(part, dict) and part.get('type') == 'image_url' else None
+        url = image_url.get('url') if isinstance(image_url, dict) else None
+        if not isinstance(url, str) or len(url) <= self.inline_max_bytes:
+            return part
+
+        match = DATA_URI_PATTERN.match(url)
+        if not match:
+            return part
+
+        try:
+            data = base64.b64decode(match.group(2), validate=True)
+        except (binascii.Error, ValueError) as e:
+            self.logger.warning(f"⚠️ 图片 data URI 解码失败，保留原内容: {str(e)}")
+            return part
+
+        digest = self.put(data)
+        image_url = dict(image_url, url=f"{BLOB_SCHEME}{digest}", mime_type=match.group(1) or 'application/octet-stream')
+        return dict(part, image_url=image_url)
+
+    def resolve(self, content: Any) -> Any:
+        """将多模态内容中的引用还原为 data URI，用于组装 LLM 请求"""
+        if not isinstance(content, list):
+            return content
+        return [self._resolve_part(part) for part in content]
+
+    def _resolve_part(self, part: Any) -> Any:
+        image_url = part.get('image_url') if isinstance(part, dict) and part.get('type') == 'image_url' else None
+        url = image_url.get('url') if isinstance(image_url, dict) else None
+        if not isinstance(url, str) or not url.startswith(BLOB_SCHEME):
+            return part
+
+        digest = url[len(BLOB_SCHEME):]
+        mime_type = image_url.get('mime_type', 'application/octet-stream')
+        data_uri = self._data_uri(digest, mime_type)
+        if data_uri is None:
+            self.logger.error(f"❌ 图片内容不存在: {digest}")
+            return {'type': 'text', 'text': f'[图片不可用: {digest}]'}
+
+        image_url = {key: value for key, value in image_url.items() if key != 'mime_type'}
+        image_url['url'] = data_uri
+        return dict(part, image_url=image_url)
+
+    def _data_uri(self, digest: str, mime_type: str) -> Optional[str]:
+        key = f"{digest}:{mime_type}"
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        data = self.get(digest)
+        if data is None:
+            return None
+
+        data_uri = f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+        with self._lock:
+            self._cache[key] = data_uri
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return data_uri
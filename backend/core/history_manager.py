@@ -4,160 +4,398 @@
 APOS 历史记录管理器
 """
 
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
-import json
+import time
 import uuid
+import asyncio
+import atexit
+import signal
+import threading
 from config.settings import Config
+from core.session_store import JsonSessionStore
+from core.session_history import SessionHistory
+from core.session_cache import SessionCache
+from core.sqlite_session_store import SqliteSessionStore
+from core.session_writer import SessionWriter
+from core.session_index import SessionIndex
+from core.session_archive import SessionArchive
+from core.session_locks import SessionLocks
+from core.blob_store import BlobStore
 from utils.logger import get_logger
 
+def _install_sigterm_handler():
+    """收到 SIGTERM 时以 SystemExit 退出，使 atexit 中的写入和索引保存得以执行
+
+    Python 默认对 SIGTERM 直接终止进程，不执行 atexit。只在主线程中、且没有其他程序
+    （如 uvicorn、gunicorn）设置过处理函数时安装，这些服务器自行处理 SIGTERM 后正常退出。
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+        return
+
+    def handle_sigterm(signum, frame):
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
 class HistoryManager:
     """历史记录管理器"""
     
     def __init__(self):
         self.logger = get_logger(__name__)
-        self.sessions: Dict[str, List[Dict[str, Any]]] = {}
         self.max_length = Config.MAX_HISTORY_LENGTH
-        self.sessions_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'sessions')
-        os.makedirs(self.sessions_dir, exist_ok=True)
-        self._load_all_sessions()
+        self.sessions_dir = Config.HISTORY_DIR or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'sessions')
+        if Config.HISTORY_BACKEND == 'sqlite':
+            self.store = SqliteSessionStore(
+                Config.HISTORY_SQLITE_PATH or os.path.join(self.sessions_dir, 'sessions.db')
+            )
+        else:
+            self.store = JsonSessionStore(self.sessions_dir)
+        # 会话变更由后台写入器批量落盘，避免阻塞请求线程
+        self.writer = SessionWriter(
+            self.store,
+            mode=Config.HISTORY_DURABILITY,
+            interval=Config.HISTORY_FLUSH_INTERVAL
+        )
+        # 会话按需加载到 LRU 缓存中
+        self.sessions = SessionCache(
+            max_messages=Config.HISTORY_CACHE_MAX_MESSAGES,
+            max_bytes=Config.HISTORY_CACHE_MAX_BYTES
+        )
         
-        self.logger.info("📚 历史记录管理器初始化完成")
-    
-    def _save_session(self, session_id: str):
-        """保存会话到文件"""
-        if session_id not in self.sessions:
-            return
+        # 同一会话的加载、变更与归档串行执行，不同会话之间互不阻塞
+        self._locks = SessionLocks()
         
-        file_path = os.path.join(self.sessions_dir, f"{session_id}.json")
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.sessions[session_id], f, ensure_ascii=False, indent=2)
-            self.logger.info(f"💾 会话已保存: {session_id} -> {file_path}")
-        except Exception as e:
-            self.logger.error(f"❌ 保存会话失败: {str(e)}")
+        # SQLite 后端自带会话表；JSON 后端使用独立的元数据索引文件，并将空闲会话压缩归档
+        self.index = None
+        self.archive = None
+        if not self.store.supports_listing:
+            self.index = SessionIndex(
+                os.path.join(self.sessions_dir, 'index.meta'),
+                save_interval=Config.HISTORY_INDEX_SAVE_INTERVAL
+            )
+            self.archive = SessionArchive(
+                os.path.join(self.sessions_dir, 'archive'),
+                bundle_max_bytes=Config.HISTORY_ARCHIVE_BUNDLE_MAX_BYTES,
+                fsync=Config.HISTORY_FSYNC != 'never'
+            )
+            # 归档或恢复过程中断时两处都有该会话，以会话目录中的为准
+            for session_id in self.archive.session_ids():
+                if self.store.exists(session_id):
+                    self.archive.remove(session_id)
+            
+            mtimes = self.store.list_mtimes()
+            mtimes.update(self.archive.list_mtimes())
+            self.index.reconcile(mtimes, self._load_session)
+            for session_id in self.archive.session_ids():
+                self.index.set_archived(session_id, True)
+            self.writer.add_flush_hook(self.index.save)
+        
+        self._archive_stop = threading.Event()
+        self._archive_thread = None
+        if self.archive and Config.HISTORY_ARCHIVE_AFTER > 0:
+            self._archive_thread = threading.Thread(target=self._archive_loop, name='session-archiver', daemon=True)
+            self._archive_thread.start()
+        # 多模态消息中的图片按内容哈希单独存放，历史记录只保留引用
+        self.blobs = BlobStore()
+        # 异步接口在线程池中执行同步读写，锁等待和磁盘 I/O 不阻塞共享事件循环
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, Config.HISTORY_IO_WORKERS), thread_name_prefix="history-io"
+        )
+        atexit.register(self.close)
+        _install_sigterm_handler()
+        
+        self.logger.info(f"📚 历史记录管理器初始化完成 - 存储后端: {Config.HISTORY_BACKEND}")
     
     def _load_session(self, session_id: str) -> List[Dict[str, Any]]:
-        """从文件加载会话"""
-        file_path = os.path.join(self.sessions_dir, f"{session_id}.json")
-        if not os.path.exists(file_path):
-            return []
-        
+        """从文件或归档加载会话消息列表"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            if self.archive and session_id in self.archive and not self.store.exists(session_id):
+                messages = self.archive.load(session_id)
+            else:
+                messages = self.store.load(session_id)
         except Exception as e:
             self.logger.error(f"❌ 加载会话失败: {str(e)}")
             return []
+        
+        # 旧版本的消息没有序号，按顺序补齐
+        last_seq = 0
+        for message in messages:
+            if 'seq' not in message:
+                message['seq'] = last_seq + 1
+            last_seq = message['seq']
+        return messages
+    
+    def _next_seq(self, session_id: str, messages: SessionHistory) -> int:
+        """分配会话内单调递增的消息序号"""
+        if messages:
+            return messages.last_seq + 1
+        # 空会话（新建或已清空）沿用元数据中记录的最后序号，保证清空后序号不回退
+        return self.get_session_info(session_id).get('last_seq', 0) + 1
+    
+    def _persist(self, session_id: str, records: List[Dict[str, Any]],
+                 index_update: Optional[Callable[[], None]] = None):
+        """提交变更记录，由写入器按持久化模式落盘
+
+        index_update 在记录写入存储后才更新会话索引，保存的索引不会领先于磁盘上的数据。
+        """
+        self.writer.submit(session_id, records, index_update if self.index else None)
+    
+    def _get_session(self, session_id: str, create: bool = False) -> Optional[SessionHistory]:
+        """获取会话历史，未缓存时从磁盘加载，已归档的会话先恢复"""
+        with self._locks.hold(session_id):
+            messages = self.sessions.get(session_id)
+            if messages is not None:
+                # 多个进程共用的存储中，会话可能已被其他进程修改，此时重新加载
+                if not self.store.shared or self.store.is_fresh(session_id):
+                    return messages
+                self.sessions.pop(session_id)
+                self.logger.info(f"🔄 会话已被其他进程修改，重新加载: {session_id}")
+            
+            # 会话可能在仍有待写记录时被淘汰，加载前先写入
+            self.writer.flush(session_id)
+            if self.store.exists(session_id):
+                messages = SessionHistory(self.max_length, self._load_session(session_id))
+                self.logger.info(f"📥 加载会话: {session_id}, 消息数量: {len(messages)}")
+            elif self.archive and session_id in self.archive:
+                messages = SessionHistory(self.max_length, self._rehydrate(session_id))
+            elif create:
+                messages = SessionHistory(self.max_length)
+            else:
+                return None
+            
+            self.sessions.put(session_id, messages)
+            return messages
     
-    def _load_all_sessions(self):
-        """加载所有会话"""
-        if not os.path.exists(self.sessions_dir):
-            return
+    def _rehydrate(self, session_id: str) -> List[Dict[str, Any]]:
+        """将已归档的会话恢复到会话目录"""
+        messages = self._load_session(session_id)
+        # 先写入会话目录再移除归档，中断时不会丢失会话
+        self.store.restore(session_id, messages)
+        self.archive.remove(session_id)
+        if self.index:
+            self.index.set_archived(session_id, False)
+        self.logger.info(f"📤 从归档恢复会话: {session_id}, 消息数量: {len(messages)}")
+        return messages
+    
+    def archive_idle_sessions(self, idle_seconds: Optional[float] = None) -> int:
+        """将空闲超过阈值的会话压缩移入归档，返回归档的会话数量"""
+        if not self.archive:
+            return 0
+        
+        idle_seconds = Config.HISTORY_ARCHIVE_AFTER if idle_seconds is None else idle_seconds
+        cutoff = time.time() - idle_seconds
+        self.writer.flush()
         
-        for filename in os.listdir(self.sessions_dir):
-            if filename.endswith('.json'):
-                session_id = filename[:-5]
-                self.sessions[session_id] = self._load_session(session_id)
+        archived = 0
+        for session_id, mtime in self.store.list_mtimes().items():
+            if mtime > cutoff or self._archive_stop.is_set():
+                continue
+            
+            try:
+                # 读取和压缩在锁外进行，提交时确认会话在此期间没有变化
+                messages = self._load_session(session_id)
+                with self._locks.hold(session_id):
+                    self.writer.flush(session_id)
+                    if self.store.mtime(session_id) != mtime:
+                        continue
+                    
+                    self.archive.put(session_id, messages)
+                    self.writer.delete(session_id)
+                    self.sessions.pop(session_id)
+                    if self.index:
+                        self.index.set_archived(session_id, True)
+                archived += 1
+            except Exception as e:
+                self.logger.error(f"❌ 归档会话失败: {session_id}, {str(e)}")
         
-        self.logger.info(f"📥 已加载 {len(self.sessions)} 个会话")
+        if archived:
+            self.logger.info(f"📦 已归档 {archived} 个空闲会话")
+            if self.index:
+                with self.writer.hold():
+                    self.index.save(force=True)
+        return archived
+    
+    def _archive_loop(self):
+        while not self._archive_stop.wait(Config.HISTORY_ARCHIVE_INTERVAL):
+            self.archive_idle_sessions()
     
     def create_new_session(self) -> str:
         """创建新会话并返回会话ID"""
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = []
-        self._save_session(session_id)
+        with self._locks.hold(session_id):
+            self.sessions.put(session_id, SessionHistory(self.max_length))
+            self._persist(session_id, [{'op': 'clear'}], lambda: self.index.on_clear(session_id))
         self.logger.info(f"✨ 创建新会话: {session_id}")
         return session_id
     
     def delete_session(self, session_id: str):
         """删除会话"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            
-        file_path = os.path.join(self.sessions_dir, f"{session_id}.json")
-        if os.path.exists(file_path):
+        with self._locks.hold(session_id):
+            self.sessions.pop(session_id)
             try:
-                os.remove(file_path)
-                self.logger.info(f"🗑️ 删除会话文件: {file_path}")
+                # 写入器丢弃待写记录后再移除索引条目，尚未执行的索引更新不会重新登记该会话
+                self.writer.delete(session_id)
+                if self.archive:
+                    self.archive.remove(session_id)
             except Exception as e:
                 self.logger.error(f"❌ 删除会话文件失败: {str(e)}")
+            finally:
+                if self.index:
+                    self.index.on_delete(session_id)
     
-    def add_message(self, session_id: str, role: str, content: Any):
-        """添加消息到历史记录"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = []
-        
-        message = {
-            'role': role,
-            'content': content,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        self.sessions[session_id].append(message)
+    def add_message(self, session_id: str, role: str, content: Any, replaces: Optional[str] = None,
+                    **fields) -> Dict[str, Any]:
+        """添加消息到历史记录，fields 为附加字段（如摘要消息的 type 和 summary_upto），返回写入的消息
+
+        replaces 为系统消息的 type 时先移除该类型的旧消息，例如新摘要替换旧摘要。
+        """
+        content = self.blobs.externalize(content)
         
-        # 限制历史记录长度
-        if len(self.sessions[session_id]) > self.max_length:
-            # 保留系统消息，删除最旧的用户/助手消息
-            system_messages = [msg for msg in self.sessions[session_id] if msg['role'] == 'system']
-            other_messages = [msg for msg in self.sessions[session_id] if msg['role'] != 'system']
+        with self._locks.hold(session_id):
+            messages = self._get_session(session_id, create=True)
+            message = {
+                'role': role,
+                'content': content,
+                'timestamp': datetime.now().isoformat(),
+                'seq': self._next_seq(session_id, messages),
+                **fields
+            }
             
-            # 保留最新的消息
-            other_messages = other_messages[-(self.max_length - len(system_messages)):]
+            records = []
+            replaced = messages.remove_type(replaces) if replaces else []
+            if replaced:
+                records.append({'op': 'remove', 'seqs': [old['seq'] for old in replaced]})
             
-            self.sessions[session_id] = system_messages + other_messages
+            # 超出长度时容器会裁剪最旧的用户/助手消息，系统消息始终保留
+            trimmed = messages.append(message)
+            records.append({'op': 'append', 'message': message})
+            if trimmed:
+                records.append({'op': 'trim', 'count': len(trimmed)})
+            
+            removed = replaced + trimmed
+            self.sessions.account(session_id, added=[message], removed=removed)
+            
+            # 追加写入会话日志
+            self._persist(session_id, records, lambda: self.index.on_message(session_id, message, removed))
         
         self.logger.info(f"📝 添加消息 - 会话: {session_id}, 角色: {role}, 长度: {len(str(content))}")
         self.logger.debug(f"💬 消息内容: {content}")
-        
-        # 保存会话到文件
-        self._save_session(session_id)
+        return message
+    
+    async def arun(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在历史记录线程池中执行会读写历史记录的同步函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+    
+    async def aadd_message(self, session_id: str, role: str, content: Any, replaces: Optional[str] = None,
+                           **fields) -> Dict[str, Any]:
+        """add_message 的异步版本"""
+        return await self.arun(self.add_message, session_id, role, content, replaces, **fields)
+    
+    async def aget_history(self, session_id: str) -> List[Dict[str, Any]]:
+        """get_history 的异步版本"""
+        return await self.arun(self.get_history, session_id)
+    
+    async def aget_last_assistant_message(self, session_id: str) -> str:
+        """get_last_assistant_message 的异步版本"""
+        return await self.arun(self.get_last_assistant_message, session_id)
     
     def get_history(self, session_id: str) -> List[Dict[str, Any]]:
         """获取历史记录"""
-        if session_id not in self.sessions:
-            return []
+        with self._locks.hold(session_id):
+            messages = self._get_session(session_id)
+            if messages is None:
+                return []
+            history = messages.to_list()
         
-        history = self.sessions[session_id].copy()
         self.logger.info(f"📖 获取历史记录 - 会话: {session_id}, 消息数量: {len(history)}")
         
         return history
     
+    def get_history_since(self, session_id: str, since_seq: int = 0,
+                          limit: Optional[int] = None) -> Dict[str, Any]:
+        """获取序号大于 since_seq 的消息，只复制返回的部分"""
+        with self._locks.hold(session_id):
+            messages = self._get_session(session_id) or SessionHistory(self.max_length)
+            page, total = messages.since(since_seq, limit)
+            
+            return {
+                'messages': page,
+                'last_seq': messages.last_seq,
+                'message_count': len(messages),
+                'next_seq': page[-1]['seq'] if page else since_seq,
+                'has_more': len(page) < total
+            }
+    
     def get_last_assistant_message(self, session_id: str) -> str:
         """获取最后一条助手消息"""
-        if session_id not in self.sessions:
-            return ""
-        
-        # 从后往前查找最后一条助手消息
-        for message in reversed(self.sessions[session_id]):
-            if message['role'] == 'assistant':
-                return message['content']
-        
-        return ""
+        with self._locks.hold(session_id):
+            messages = self._get_session(session_id)
+            if messages is None:
+                return ""
+            
+            # 从后往前查找最后一条助手消息
+            message = messages.last_message('assistant')
+        return message['content'] if message else ""
     
     def clear_history(self, session_id: str):
         """清除历史记录"""
-        if session_id in self.sessions:
-            self.sessions[session_id] = []
-            self._save_session(session_id)
-            self.logger.info(f"🗑️ 清除历史记录 - 会话: {session_id}")
+        with self._locks.hold(session_id):
+            messages = self._get_session(session_id)
+            if messages is None:
+                return
+            
+            # 记录最后的序号，写入器合并记录后存储仍能保持序号单调
+            clear = {'op': 'clear', 'last_seq': messages.last_seq}
+            removed = messages.clear()
+            self.sessions.account(session_id, removed=removed)
+            self._persist(session_id, [clear], lambda: self.index.on_clear(session_id))
+        self.logger.info(f"🗑️ 清除历史记录 - 会话: {session_id}")
     
     def get_all_sessions(self) -> List[str]:
         """获取所有会话ID"""
-        return list(self.sessions.keys())
+        # 会话索引和 SQLite 会话表都在记录写入后更新，查询前先写入待写记录
+        self.writer.flush()
+        if self.index:
+            return self.index.session_ids()
+        return self.store.list_ids()
+    
+    def list_sessions(self, sort_by: str = 'last_updated', order: str = 'desc',
+                      offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """排序分页列出会话元数据，返回 (当前页, 总数)，不读取消息内容"""
+        self.writer.flush()
+        if self.index:
+            return self.index.list_sessions(sort_by, order, offset, limit)
+        return self.store.list_sessions(sort_by, order, offset, limit)
     
     def get_session_info(self, session_id: str) -> Dict[str, Any]:
         """获取会话信息"""
-        if session_id not in self.sessions:
-            return {}
-        
-        messages = self.sessions[session_id]
-        
-        return {
-            'session_id': session_id,
-            'message_count': len(messages),
-            'created_at': messages[0]['timestamp'] if messages else None,
-            'last_updated': messages[-1]['timestamp'] if messages else None
-        }
-
+        self.writer.flush(session_id)
+        if self.index:
+            return self.index.get(session_id) or {}
+        return self.store.get_session_info(session_id) or {}
+    
+    def close(self):
+        """停止归档线程，写入所有待写记录并保存会话索引"""
+        self._archive_stop.set()
+        if self._archive_thread is not None:
+            self._archive_thread.join()
+        self.executor.shutdown(wait=True)
+        self.writer.close()
+        if self.index:
+            with self.writer.hold():
+                self.index.save(force=True)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取会话缓存统计"""
+        return self.sessions.get_stats()
+    
+    def get_archive_stats(self) -> Optional[Dict[str, Any]]:
+        """获取会话归档统计，未启用归档时返回 None"""
+        return self.archive.get_stats() if self.archive else None
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 后台任务队列模块
+
+长时间运行的对话以任务形式提交：接口立即返回任务ID，固定数量的工作协程在共享事件循环中
+依次执行排队的任务，客户端轮询任务状态或订阅事件流获取进度和结果。
+排队任务数有上限，超出时拒绝提交，突发请求下负载保持可控；结束的任务保留一段时间后清除。
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+import asyncio
+import bisect
+import threading
+import time
+import uuid
+from utils.async_runner import runner
+from utils.logger import get_logger
+
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+class Job:
+    """一次后台对话任务"""
+
+    def __init__(self, session_id: str, user_message: str, images: List[str]):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.user_message = user_message
+        self.images = images
+        # queued / running / completed / failed
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Agent 产出的事件 (下标, 事件)，下标递增，事件流订阅者按下标续读；
+        # 超出上限时丢弃最旧的事件，任务结束后丢弃 token 事件，下标保持不变
+        self.events: List[Tuple[int, Dict[str, Any]]] = []
+        self.event_count = 0
+        # 最后的 done 事件（不含 type 字段），与 /api/chat 的响应相同
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'session_id': self.session_id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'event_count': self.event_count,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class JobQueue:
+    """有界的后台任务队列"""
+
+    def __init__(self, agent, workers: int, max_queued: int, result_ttl: float, max_events: int = 2000):
+        self.logger = get_logger(__name__)
+        self.agent = agent
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.max_events = max(1, max_events)
+
+        self._jobs: Dict[str, Job] = {}
+        # 按结束顺序记录已结束的任务，过期清理时从头部弹出
+        self._finished: deque = deque()
+        self._queued = 0
+        self._running = 0
+        self.submitted = 0
+        self.rejected = 0
+        # 任务状态由工作协程更新、由请求线程读取，事件追加时唤醒订阅者
+        self._cond = threading.Condition()
+
+        # 队列和工作协程在共享事件循环中首次提交时创建
+        self._queue: Optional[asyncio.Queue] = None
+
+    def submit(self, session_id: str, user_message: str, images: List[str] = None) -> Job:
+        """提交任务，排队任务数已达上限时抛出 JobQueueFull"""
+        job = Job(session_id, user_message, images or [])
+        with self._cond:
+            self._expire()
+            if self.max_queued > 0 and self._queued >= self.max_queued:
+                self.rejected += 1
+                raise JobQueueFull(f"排队任务数已达上限 ({self.max_queued})")
+            self._jobs[job.job_id] = job
+            self._queued += 1
+            self.submitted += 1
+
+        runner.loop.call_soon_threadsafe(self._enqueue, job.job_id)
+        self.logger.info(f"📥 提交任务 {job.job_id} - 会话: {session_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态，不存在或已过期时返回 None"""
+        with self._cond:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def iter_events(self, job_id: str, since: int = 0,
+                    heartbeat: float = 15.0) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+        """阻塞迭代任务事件 (下标, 事件)，从下标 since 开始，任务结束后停止
+
+        超过 heartbeat 秒没有新事件时产出 (下标, None)，调用方据此发送心跳保持连接。
+        since 之后的事件已被丢弃时从保留的最早事件继续。
+        """
+        deadline = time.monotonic() + heartbeat
+        while True:
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                # 所有任务共用一个条件变量，被其他任务的事件唤醒时继续等待
+                while job.event_count <= since and not job.finished:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                start = bisect.bisect_left(job.events, since, key=lambda item: item[0])
+                events = job.events[start:]
+                finished = job.finished
+
+            deadline = time.monotonic() + heartbeat
+            if not events:
+                if finished:
+                    return
+                yield since, None
+                continue
+
+            for index, event in events:
+                yield index, event
+            since = max(since, events[-1][0] + 1)
+
+    def _expire(self):
+        """清除超过保留时间的已结束任务，调用方需持有锁"""
+        deadline = time.time() - self.result_ttl
+        while self._finished and self._finished[0][1] <= deadline:
+            job_id, _ = self._finished.popleft()
+            self._jobs.pop(job_id, None)
+
+    def _enqueue(self, job_id: str):
+        """在共享事件循环中放入队列，首次调用时启动工作协程"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            for index in range(self.workers):
+                asyncio.ensure_future(self._worker(index))
+            self.logger.info(f"👷 启动 {self.workers} 个任务工作协程")
+        self._queue.put_nowait(job_id)
+
+    async def _worker(self, index: int):
+        """依次执行队列中的任务"""
+        while True:
+            job_id = await self._queue.get()
+            with self._cond:
+                job = self._jobs.get(job_id)
+                self._queued -= 1
+                if job is None:
+                    continue
+                job.status = 'running'
+                job.started_at = time.time()
+                self._running += 1
+
+            self.logger.info(f"🏃 工作协程 {index} 开始执行任务 {job_id}")
+            try:
+                async for event in self.agent.astream_message(job.user_message, job.session_id, job.images):
+                    with self._cond:
+                        job.events.append((job.event_count, event))
+                        job.event_count += 1
+                        if len(job.events) > self.max_events:
+                            self._trim_events(job)
+                        if event['type'] == 'done':
+                            job.result = {key: value for key, value in event.items() if key != 'type'}
+                        self._cond.notify_all()
+                status, error = 'completed', None
+                # 对话循环内部的异常以 status 为 error 的 done 事件结束，不会抛出
+                if job.result and job.result.get('status') == 'error':
+                    self.logger.error(f"❌ 任务执行失败 {job_id}: {job.result.get('error')}")
+                    status, error = 'failed', job.result.get('error')
+            except Exception as e:
+                self.logger.error(f"❌ 任务执行失败 {job_id}: {str(e)}")
+                status, error = 'failed', str(e)
+
+            with self._cond:
+                job.status = status
+                job.error = error
+                # 完整回复已在 result 中，结束后不再保留逐个文本片段
+                job.events = [item for item in job.events if item[1]['type'] != 'token']
+                job.finished_at = time.time()
+                self._running -= 1
+                self._finished.append((job_id, job.finished_at))
+                self._cond.notify_all()
+            self.logger.info(f"✅ 任务结束 {job_id} - 状态: {status}")
+
+    def _trim_events(self, job: Job):
+        """事件超出上限时先丢弃较早一半中的 token 事件，仍超出时丢弃最旧的事件，调用方需持有锁"""
+        half = len(job.events) // 2
+        job.events = [item for item in job.events[:half] if item[1]['type'] != 'token'] + job.events[half:]
+        if len(job.events) > self.max_events:
+            del job.events[:len(job.events) - self.max_events]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计"""
+        with self._cond:
+            self._expire()
+            return {
+                'workers': self.workers,
+                'max_queued': self.max_queued,
+                'queued': self._queued,
+                'running': self._running,
+                'finished': len(self._finished),
+                'submitted': self.submitted,
+                'rejected': self.rejected
+            }
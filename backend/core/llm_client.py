@@ -5,8 +5,10 @@ APOS LLM 客户端模块
 """
 
 import openai
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, AsyncIterator
 from config.settings import Config
+from core.blob_store import BlobStore
+from core.token_counter import TokenCounter
 from utils.logger import get_logger
 
 class LLMClient:
@@ -23,64 +25,169 @@ class LLMClient:
             api_key=Config.OPENAI_API_KEY,
             base_url=Config.OPENAI_API_BASE
         )
+        # 异步客户端，供事件循环中的 Agent 使用，等待网络时不占用线程
+        self.async_client = openai.AsyncOpenAI(
+            api_key=Config.OPENAI_API_KEY,
+            base_url=Config.OPENAI_API_BASE
+        )
         
         self.model = Config.OPENAI_API_MODEL
+        self.max_tokens = Config.LLM_MAX_TOKENS
+        # 本地 token 计数，用于按预算组装上下文
+        self.tokens = TokenCounter(self.model, cache_size=Config.TOKEN_CACHE_SIZE)
+        # 历史记录中的图片引用在组装请求时还原
+        self.blobs = BlobStore()
         
         self.logger.info("🔗 LLM 客户端初始化完成")
     
-    def chat(self, system_prompt: str, messages: List[Dict[str, Any]]) -> str:
-        """发送聊天请求"""
+    def _build_messages(self, system_prompt: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """构建发送给 LLM 的消息列表"""
+        chat_messages = [
+            {"role": "system", "content": system_prompt}
+        ]
+        
+        # 添加历史消息
+        for msg in messages:
+            role = msg['role']
+            content = msg['content']
+            
+            # 处理多模态消息
+            if isinstance(content, list):
+                # 多模态消息（文本 + 图片），将图片引用还原为 data URI
+                chat_messages.append({
+                    "role": role,
+                    "content": self.blobs.resolve(content)
+                })
+            else:
+                # 纯文本消息
+                chat_messages.append({
+                    "role": role,
+                    "content": content
+                })
+        
+        return chat_messages
+    
+    def _completion_args(self, chat_messages: List[Dict[str, Any]], stop: List[str] = None,
+                         stream: bool = False, model: str = None) -> Dict[str, Any]:
+        """同步和异步请求共用的参数"""
+        args = {
+            'model': model or self.model,
+            'messages': chat_messages,
+            'temperature': 0.7,
+            'max_tokens': self.max_tokens
+        }
+        if stop:
+            args['stop'] = stop
+        if stream:
+            args['stream'] = True
+        return args
+    
+    def _extract_content(self, response) -> str:
+        """提取非流式响应的文本"""
+        if hasattr(response, 'choices') and len(response.choices) > 0:
+            content = response.choices[0].message.content
+        else:
+            content = str(response)
+        
+        self.logger.info(f"📥 收到 LLM 响应 - 长度: {len(content)}")
+        self.logger.debug(f"📝 响应内容: {content}")
+        return content
+    
+    def chat(self, system_prompt: str, messages: List[Dict[str, Any]], stop: List[str] = None) -> str:
+        """发送聊天请求，stop 为可选的停止序列"""
         try:
             # 构建消息列表
-            chat_messages = [
-                {"role": "system", "content": system_prompt}
-            ]
-            
-            # 添加历史消息
-            for msg in messages:
-                role = msg['role']
-                content = msg['content']
-                
-                # 处理多模态消息
-                if isinstance(content, list):
-                    # 多模态消息（文本 + 图片）
-                    chat_messages.append({
-                        "role": role,
-                        "content": content
-                    })
-                else:
-                    # 纯文本消息
-                    chat_messages.append({
-                        "role": role,
-                        "content": content
-                    })
+            chat_messages = self._build_messages(system_prompt, messages)
             
             self.logger.info(f"📤 发送请求到 LLM - 消息数量: {len(chat_messages)}")
             self.logger.debug(f"📋 请求详情: {chat_messages}")
             
             # 发送请求
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=chat_messages,
-                temperature=0.7,
-                max_tokens=4000
-            )
+            response = self.client.chat.completions.create(**self._completion_args(chat_messages, stop))
             
             # 提取响应内容
-            if hasattr(response, 'choices') and len(response.choices) > 0:
-                content = response.choices[0].message.content
-            else:
-                content = str(response)
+            return self._extract_content(response)
             
-            self.logger.info(f"📥 收到 LLM 响应 - 长度: {len(content)}")
-            self.logger.debug(f"📝 响应内容: {content}")
+        except Exception as e:
+            self.logger.error(f"❌ LLM 请求错误: {str(e)}")
+            raise e
+    
+    def chat_stream(self, system_prompt: str, messages: List[Dict[str, Any]]) -> Iterator[str]:
+        """流式发送聊天请求，逐段产出生成的文本；提前关闭生成器会中断生成"""
+        chat_messages = self._build_messages(system_prompt, messages)
+        self.logger.info(f"📤 发送流式请求到 LLM - 消息数量: {len(chat_messages)}")
+        self.logger.debug(f"📋 请求详情: {chat_messages}")
+        
+        try:
+            stream = self.client.chat.completions.create(**self._completion_args(chat_messages, stream=True))
+        except Exception as e:
+            self.logger.error(f"❌ LLM 流式请求错误: {str(e)}")
+            raise e
+        
+        length = 0
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    length += len(delta)
+                    yield delta
+            self.logger.info(f"📥 LLM 流式响应结束 - 长度: {length}")
+        except Exception as e:
+            self.logger.error(f"❌ LLM 流式响应错误: {str(e)}")
+            raise e
+        finally:
+            # 关闭底层连接，调用方提前结束时不再接收剩余内容
+            stream.close()
+    
+    async def achat(self, system_prompt: str, messages: List[Dict[str, Any]], stop: List[str] = None,
+                    model: str = None) -> str:
+        """异步发送聊天请求，与 chat 相同；model 可指定其他模型"""
+        try:
+            chat_messages = self._build_messages(system_prompt, messages)
             
-            return content
+            self.logger.info(f"📤 发送异步请求到 LLM - 消息数量: {len(chat_messages)}")
+            self.logger.debug(f"📋 请求详情: {chat_messages}")
+            
+            response = await self.async_client.chat.completions.create(
+                **self._completion_args(chat_messages, stop, model=model)
+            )
+            return self._extract_content(response)
             
         except Exception as e:
             self.logger.error(f"❌ LLM 请求错误: {str(e)}")
             raise e
     
+    async def achat_stream(self, system_prompt: str, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """异步流式发送聊天请求，与 chat_stream 相同；提前关闭生成器会中断生成"""
+        chat_messages = self._build_messages(system_prompt, messages)
+        self.logger.info(f"📤 发送异步流式请求到 LLM - 消息数量: {len(chat_messages)}")
+        self.logger.debug(f"📋 请求详情: {chat_messages}")
+        
+        try:
+            stream = await self.async_client.chat.completions.create(**self._completion_args(chat_messages, stream=True))
+        except Exception as e:
+            self.logger.error(f"❌ LLM 流式请求错误: {str(e)}")
+            raise e
+        
+        length = 0
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    length += len(delta)
+                    yield delta
+            self.logger.info(f"📥 LLM 流式响应结束 - 长度: {length}")
+        except Exception as e:
+            self.logger.error(f"❌ LLM 流式响应错误: {str(e)}")
+            raise e
+        finally:
+            # 关闭底层连接，调用方提前结束时不再接收剩余内容
+            await stream.close()
+    
     def create_multimodal_content(self, text: str, image_urls: List[str] = None) -> List[Dict[str, Any]]:
         """创建多模态内容"""
         content = []
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 会话归档模块
+
+长期未访问的会话从会话目录移入压缩归档：
+- archive/bundle-<编号>.gz  每个会话压缩为一个独立的 gzip 成员，依次追加到当前归档包
+- archive/index.json        会话所在的归档包、偏移和长度
+
+归档包可直接用 zcat 查看。会话被恢复或删除后，其成员成为无效数据，
+归档包中有效数据不足一半时将有效成员迁移到当前归档包，全部失效时删除。
+"""
+
+from typing import Dict, List, Any
+import os
+import json
+import gzip
+import time
+import threading
+from utils.logger import get_logger
+
+BUNDLE_PREFIX = 'bundle-'
+BUNDLE_SUFFIX = '.gz'
+
+
+class SessionArchive:
+    """gzip 归档包 + 索引形式的冷会话存储"""
+
+    def __init__(self, archive_dir: str, bundle_max_bytes: int = 64 * 1024 * 1024, fsync: bool = True):
+        self.logger = get_logger(__name__)
+        self.archive_dir = archive_dir
+        self.index_path = os.path.join(archive_dir, 'index.json')
+        self.bundle_max_bytes = bundle_max_bytes
+        self.fsync = fsync
+
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.next_bundle = 1
+        self._lock = threading.RLock()
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = data['sessions']
+            self.next_bundle = data['next_bundle']
+        except Exception as e:
+            self.logger.error(f"❌ 加载归档索引失败: {str(e)}")
+
+    def _save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'next_bundle': self.next_bundle, 'sessions': self.entries}, f, ensure_ascii=False)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def _bundle_path(self, bundle: str) -> str:
+        return os.path.join(self.archive_dir, bundle)
+
+    def _active_bundle(self) -> str:
+        """获取当前追加的归档包，超过大小上限时换新包"""
+        bundle = f"{BUNDLE_PREFIX}{self.next_bundle:06d}{BUNDLE_SUFFIX}"
+        path = self._bundle_path(bundle)
+        if os.path.exists(path) and os.path.getsize(path) >= self.bundle_max_bytes:
+            self.next_bundle += 1
+            bundle = f"{BUNDLE_PREFIX}{self.next_bundle:06d}{BUNDLE_SUFFIX}"
+        return bundle
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self.entries
+
+    def session_ids(self) -> List[str]:
+        """获取所有已归档的会话ID"""
+        with self._lock:
+            return list(self.entries)
+
+    def list_mtimes(self) -> Dict[str, float]:
+        """列出已归档会话及其归档时间"""
+        with self._lock:
+            return {session_id: entry['archived_at'] for session_id, entry in self.entries.items()}
+
+    def put(self, session_id: str, messages: List[Dict[str, Any]]):
+        """压缩会话并追加到当前归档包"""
+        data = gzip.compress(json.dumps(
+            {'session_id': session_id, 'messages': messages}, ensure_ascii=False
+        ).encode('utf-8'))
+
+        with self._lock:
+            bundle = self._active_bundle()
+            with open(self._bundle_path(bundle), 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+            previous = self.entries.get(session_id)
+            self.entries[session_id] = {
+                'bundle': bundle,
+                'offset': offset,
+                'length': len(data),
+                'message_count': len(messages),
+                'archived_at': time.time()
+            }
+            self._save()
+            if previous:
+                self._collect(previous['bundle'])
+
+    def load(self, session_id: str) -> List[Dict[str, Any]]:
+        """读取并解压已归档的会话"""
+        with self._lock:
+            entry = self.entries[session_id]
+            with open(self._bundle_path(entry['bundle']), 'rb') as f:
+                f.seek(entry['offset'])
+                data = f.read(entry['length'])
+        return json.loads(gzip.decompress(data).decode('utf-8'))['messages']
+
+    def remove(self, session_id: str):
+        """移除会话的归档记录（恢复或删除会话后调用）"""
+        with self._lock:
+            entry = self.entries.pop(session_id, None)
+            if entry is None:
+                return
+            self._save()
+            self._collect(entry['bundle'])
+
+    def _collect(self, bundle: str):
+        """回收归档包中失效的数据"""
+        live = [(session_id, entry) for session_id, entry in self.entries.items() if entry['bundle'] == bundle]
+        path = self._bundle_path(bundle)
+        if not os.path.exists(path):
+            return
+
+        if not live:
+            os.remove(path)
+            self.logger.info(f"🗑️ 删除空归档包: {bundle}")
+            return
+
+        size = os.path.getsize(path)
+        live_bytes = sum(entry['length'] for _, entry in live)
+        if live_bytes * 2 >= size:
+            return
+
+        # 有效数据不足一半时，将有效成员复制到当前归档包，索引保存后再删除旧包
+        active = self._active_bundle()
+        if bundle == active:
+            return
+
+        with open(path, 'rb') as src, open(self._bundle_path(active), 'ab') as dst:
+            for _, entry in sorted(live, key=lambda item: item[1]['offset']):
+                src.seek(entry['offset'])
+                data = src.read(entry['length'])
+                entry['bundle'] = active
+                entry['offset'] = dst.tell()
+                dst.write(data)
+            dst.flush()
+            if self.fsync:
+                os.fsync(dst.fileno())
+        self._save()
+        os.remove(path)
+        self.logger.info(f"🗜️ 重写归档包: {bundle} -> {active}, 有效数据 {live_bytes}/{size} 字节")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取归档统计"""
+        with self._lock:
+            bundles = {entry['bundle'] for entry in self.entries.values()}
+            return {
+                'sessions': len(self.entries),
+                'bundles': len(bundles),
+                'bytes': sum(
+                    os.path.getsize(self._bundle_path(bundle)) for bundle in bundles
+                    if os.path.exists(self._bundle_path(bundle))
+                )
+            }
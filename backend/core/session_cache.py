@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 会话缓存模块
+
+按最近使用顺序缓存已加载的会话，总消息数或估算字节数超过上限时
+淘汰最久未使用的会话。会话在磁盘上已完整持久化，淘汰后按需重新加载。
+"""
+
+from typing import Dict, List, Any, Optional
+from collections import OrderedDict
+import threading
+from core.session_history import SessionHistory
+
+
+def estimate_message_size(message: Dict[str, Any]) -> int:
+    """估算单条消息占用的字节数"""
+    return len(str(message.get('content', ''))) + 64
+
+
+class SessionCache:
+    """LRU 会话缓存"""
+
+    def __init__(self, max_messages: int, max_bytes: int):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+
+        self._entries: 'OrderedDict[str, SessionHistory]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self.total_messages = 0
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 不同会话的请求线程同时访问缓存
+        self._lock = threading.RLock()
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def get(self, session_id: str) -> Optional[SessionHistory]:
+        """获取会话历史，未命中返回 None"""
+        with self._lock:
+            messages = self._entries.get(session_id)
+            if messages is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return messages
+
+    def put(self, session_id: str, messages: SessionHistory):
+        """放入会话并按需淘汰"""
+        size = sum(estimate_message_size(message) for message in messages)
+        with self._lock:
+            self.pop(session_id)
+            self._entries[session_id] = messages
+            self._sizes[session_id] = size
+            self.total_messages += len(messages)
+            self.total_bytes += size
+            self._evict()
+
+    def account(self, session_id: str, added: List[Dict[str, Any]] = (), removed: List[Dict[str, Any]] = ()):
+        """登记会话中新增和移除的消息，更新占用统计"""
+        delta = sum(estimate_message_size(message) for message in added)
+        delta -= sum(estimate_message_size(message) for message in removed)
+        with self._lock:
+            if session_id not in self._entries:
+                return
+
+            self._sizes[session_id] += delta
+            self.total_bytes += delta
+            self.total_messages += len(added) - len(removed)
+            self._entries.move_to_end(session_id)
+            self._evict()
+
+    def pop(self, session_id: str) -> Optional[SessionHistory]:
+        """移除会话"""
+        with self._lock:
+            messages = self._entries.pop(session_id, None)
+            if messages is not None:
+                self.total_messages -= len(messages)
+                self.total_bytes -= self._sizes.pop(session_id)
+            return messages
+
+    def _evict(self):
+        # 至少保留最近使用的一个会话，即使它本身超过上限
+        while len(self._entries) > 1 and (
+            self.total_messages > self.max_messages or self.total_bytes > self.max_bytes
+        ):
+            session_id = next(iter(self._entries))
+            self.pop(session_id)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'sessions': len(self._entries),
+                'messages': self.total_messages,
+                'bytes': self.total_bytes,
+                'max_messages': self.max_messages,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
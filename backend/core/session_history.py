@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 会话消息容器模块
+
+系统消息保存在固定区域，永不裁剪；其余消息保存在双端队列中。
+超过最大长度时从队列头部弹出最旧的消息，每次追加的裁剪代价为 O(1)。
+两部分都按 seq 递增，读取时按 seq 归并还原对话顺序。
+"""
+
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+from collections import deque
+from itertools import islice
+import bisect
+import heapq
+
+
+def _seq(message: Dict[str, Any]) -> int:
+    return message['seq']
+
+
+class SessionHistory:
+    """带固定系统消息区域的环形会话历史"""
+
+    def __init__(self, max_length: int, messages: List[Dict[str, Any]] = ()):
+        self.max_length = max_length
+        self.pinned: List[Dict[str, Any]] = []
+        self.recent: deque = deque()
+        for message in messages:
+            self.append(message)
+
+    def __len__(self) -> int:
+        return len(self.pinned) + len(self.recent)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return heapq.merge(self.pinned, self.recent, key=_seq)
+
+    @property
+    def last_seq(self) -> int:
+        """最后一条消息的序号，空会话返回 0"""
+        return max(
+            self.pinned[-1]['seq'] if self.pinned else 0,
+            self.recent[-1]['seq'] if self.recent else 0
+        )
+
+    def append(self, message: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """追加消息，返回因超出长度被裁剪的消息"""
+        if message['role'] == 'system':
+            self.pinned.append(message)
+        else:
+            self.recent.append(message)
+
+        # 保留系统消息，删除最旧的用户/助手消息
+        removed = []
+        while self.recent and len(self) > self.max_length:
+            removed.append(self.recent.popleft())
+        return removed
+
+    def remove_type(self, message_type: str) -> List[Dict[str, Any]]:
+        """移除固定区域中 type 字段为 message_type 的消息，返回被移除的消息"""
+        removed = [message for message in self.pinned if message.get('type') == message_type]
+        if removed:
+            self.pinned = [message for message in self.pinned if message.get('type') != message_type]
+        return removed
+
+    def clear(self) -> List[Dict[str, Any]]:
+        """清空会话，返回被移除的消息"""
+        removed = list(self)
+        self.pinned.clear()
+        self.recent.clear()
+        return removed
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """按对话顺序复制全部消息"""
+        return list(self)
+
+    def since(self, since_seq: int, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """按对话顺序返回序号大于 since_seq 的消息，以及满足条件的消息总数"""
+        pinned_start = bisect.bisect_right(self.pinned, since_seq, key=_seq)
+        recent_start = bisect.bisect_right(self.recent, since_seq, key=_seq)
+
+        # 从队列尾部取出所需部分，避免从头遍历整个队列
+        recent_tail = list(islice(reversed(self.recent), len(self.recent) - recent_start))
+        recent_tail.reverse()
+
+        merged = heapq.merge(self.pinned[pinned_start:], recent_tail, key=_seq)
+        total = len(self.pinned) - pinned_start + len(recent_tail)
+        return list(islice(merged, limit)), total
+
+    def last_message(self, role: str) -> Optional[Dict[str, Any]]:
+        """从后往前查找指定角色的最后一条消息"""
+        region = self.pinned if role == 'system' else self.recent
+        for message in reversed(region):
+            if message['role'] == role:
+                return message
+        return None
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 会话元数据索引模块
+
+为 JSON 存储后端维护每个会话的消息数量、创建时间、最后更新时间、标题和大小，
+列出会话时无需加载消息内容。索引在变更记录写入存储后增量更新，并定期整体保存为一个文件，
+保存的索引不会领先于磁盘上的数据。
+"""
+
+from typing import Dict, List, Any, Optional, Tuple
+import os
+import json
+import time
+import threading
+from core.session_cache import estimate_message_size
+from utils.logger import get_logger
+
+SORT_FIELDS = ('last_updated', 'created_at', 'message_count', 'size', 'title')
+TITLE_LENGTH = 50
+
+
+def make_title(content: Any) -> str:
+    """根据消息内容生成会话标题"""
+    if isinstance(content, list):
+        # 多模态消息取第一段文本
+        texts = [part.get('text', '') for part in content if isinstance(part, dict) and part.get('type') == 'text']
+        content = texts[0] if texts else ''
+    return ' '.join(str(content).split())[:TITLE_LENGTH]
+
+
+def sort_sessions(sessions: List[Dict[str, Any]], sort_by: str, order: str) -> List[Dict[str, Any]]:
+    """按字段排序会话，空值排在升序的最前、降序的最后"""
+    if sort_by not in SORT_FIELDS:
+        raise ValueError(f"不支持的排序字段: {sort_by}")
+    return sorted(
+        sessions,
+        key=lambda info: (info.get(sort_by) is not None, info[sort_by] if info.get(sort_by) is not None else 0),
+        reverse=(order == 'desc')
+    )
+
+
+class SessionIndex:
+    """会话元数据索引"""
+
+    def __init__(self, index_path: str, save_interval: float = 1.0):
+        self.logger = get_logger(__name__)
+        self.index_path = index_path
+        self.save_interval = save_interval
+
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self.saved_at = 0.0
+
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = data['sessions']
+            self.saved_at = data['saved_at']
+        except Exception as e:
+            self.logger.error(f"❌ 加载会话索引失败，将重建: {str(e)}")
+            self.entries = {}
+
+    def reconcile(self, store_mtimes: Dict[str, float], loader):
+        """与存储中的会话对齐：补齐缺失或过期的条目，移除已不存在的会话"""
+        with self._lock:
+            stale = [
+                session_id for session_id, mtime in store_mtimes.items()
+                if session_id not in self.entries or mtime > self.saved_at
+            ]
+            removed = [session_id for session_id in self.entries if session_id not in store_mtimes]
+
+            for session_id in removed:
+                del self.entries[session_id]
+            for session_id in stale:
+                self.rebuild(session_id, loader(session_id))
+
+            if stale or removed:
+                self.logger.info(f"🔁 会话索引已更新: 重建 {len(stale)} 个, 移除 {len(removed)} 个")
+                self.save(force=True)
+
+    def rebuild(self, session_id: str, messages: List[Dict[str, Any]]):
+        """根据完整消息列表重建条目"""
+        with self._lock:
+            self.on_clear(session_id)
+            for message in messages:
+                self.on_append(session_id, message)
+
+    def _entry(self, session_id: str) -> Dict[str, Any]:
+        entry = self.entries.get(session_id)
+        if entry is None:
+            entry = {
+                'message_count': 0,
+                'created_at': None,
+                'last_updated': None,
+                'title': None,
+                'size': 0,
+                'last_seq': 0,
+                'archived': False
+            }
+            self.entries[session_id] = entry
+        return entry
+
+    def on_append(self, session_id: str, message: Dict[str, Any]):
+        """登记新增消息"""
+        with self._lock:
+            entry = self._entry(session_id)
+            entry['message_count'] += 1
+            entry['size'] += estimate_message_size(message)
+            entry['last_updated'] = message.get('timestamp')
+            entry['last_seq'] = message.get('seq', entry['last_seq'])
+            if entry['created_at'] is None:
+                entry['created_at'] = message.get('timestamp')
+            if entry['title'] is None and message['role'] == 'user':
+                entry['title'] = make_title(message['content'])
+            self._dirty = True
+
+    def on_message(self, session_id: str, message: Dict[str, Any], removed: List[Dict[str, Any]]):
+        """登记新增消息及因此被替换或裁剪的消息"""
+        with self._lock:
+            self.on_append(session_id, message)
+            self.on_remove(session_id, removed)
+
+    def on_remove(self, session_id: str, removed: List[Dict[str, Any]]):
+        """登记被裁剪的消息"""
+        if not removed:
+            return
+        with self._lock:
+            entry = self._entry(session_id)
+            entry['message_count'] -= len(removed)
+            entry['size'] -= sum(estimate_message_size(message) for message in removed)
+            self._dirty = True
+
+    def on_clear(self, session_id: str):
+        """登记会话被清空（新建会话同样视为清空），保留最后的消息序号"""
+        with self._lock:
+            entry = self.entries.pop(session_id, None)
+            self._entry(session_id)['last_seq'] = entry['last_seq'] if entry else 0
+            self._dirty = True
+
+    def on_delete(self, session_id: str):
+        """登记会话被删除"""
+        with self._lock:
+            if self.entries.pop(session_id, None) is not None:
+                self._dirty = True
+
+    def set_archived(self, session_id: str, archived: bool):
+        """标记会话是否已移入归档"""
+        with self._lock:
+            entry = self._entry(session_id)
+            if entry.get('archived', False) != archived:
+                entry['archived'] = archived
+                self._dirty = True
+
+    def session_ids(self) -> List[str]:
+        """获取所有会话ID"""
+        with self._lock:
+            return list(self.entries)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话元数据"""
+        with self._lock:
+            entry = self.entries.get(session_id)
+            return dict(entry, session_id=session_id) if entry is not None else None
+
+    def list_sessions(self, sort_by: str = 'last_updated', order: str = 'desc',
+                      offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """排序分页列出会话元数据，返回 (当前页, 总数)"""
+        with self._lock:
+            sessions = [dict(entry, session_id=session_id) for session_id, entry in self.entries.items()]
+
+        sessions = sort_sessions(sessions, sort_by, order)
+        end = None if limit is None else offset + limit
+        return sessions[offset:end], len(sessions)
+
+    def save(self, force: bool = False):
+        """保存索引文件；未强制时按保存间隔节流"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty and not force:
+                    return
+                if not force and time.monotonic() - self._last_save < self.save_interval:
+                    return
+
+                # 记录序列化时刻，晚于该时刻修改的会话在下次启动时重建
+                saved_at = time.time()
+                data = json.dumps({'saved_at': saved_at, 'sessions': self.entries}, ensure_ascii=False)
+                self._dirty = False
+                self._last_save = time.monotonic()
+
+            tmp_path = f"{self.index_path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.index_path)
+                self.saved_at = saved_at
+            except Exception as e:
+                self.logger.error(f"❌ 保存会话索引失败: {str(e)}")
+                self._dirty = True
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 会话锁模块
+
+为每个会话分配一把可重入锁：同一会话的操作串行执行，不同会话之间完全并行。
+锁在没有线程持有或等待时自动回收，会话数量增长不会导致锁表无限增大。
+
+AsyncSessionLocks 是供协程使用的版本，持有期间不阻塞事件循环。
+"""
+
+from typing import Dict, List
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import threading
+
+
+class SessionLocks:
+    """按会话分配的可重入锁"""
+
+    def __init__(self):
+        # 会话ID -> [锁, 持有及等待的线程数]
+        self._locks: Dict[str, List] = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, session_id: str):
+        """持有会话锁直到退出上下文"""
+        with self._guard:
+            entry = self._locks.get(session_id)
+            if entry is None:
+                entry = self._locks[session_id] = [threading.RLock(), 0]
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[session_id]
+
+    def __len__(self) -> int:
+        with self._guard:
+            return len(self._locks)
+
+
+class AsyncSessionLocks:
+    """按会话分配的协程锁，只能在同一个事件循环中使用，不可重入"""
+
+    def __init__(self):
+        # 会话ID -> [锁, 持有及等待的协程数]
+        self._locks: Dict[str, List] = {}
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        """持有会话锁直到退出上下文"""
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    def __len__(self) -> int:
+        return len(self._locks)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 会话存储模块
+
+每个会话由两个文件组成：
+- <session_id>.json   快照，保存压缩时刻的完整消息列表
+- <session_id>.jsonl  追加日志，快照之后的每次变更追加一行
+
+加载时先读取快照，再按顺序回放日志中序号大于快照 log_seq 的记录。
+日志累积到一定条数后压缩为新的快照并清空日志。
+"""
+
+from typing import Dict, List, Any, Tuple
+import os
+import json
+import time
+import threading
+from config.settings import Config
+from utils.logger import get_logger
+
+SNAPSHOT_SUFFIX = '.json'
+LOG_SUFFIX = '.jsonl'
+
+
+class JsonSessionStore:
+    """基于 JSON 快照 + 追加日志的会话存储"""
+
+    # 会话元数据由 HistoryManager 的 SessionIndex 维护
+    supports_listing = False
+    # 只由一个进程使用，缓存的会话无需检查其他进程的修改
+    shared = False
+
+    def __init__(self, sessions_dir: str):
+        self.logger = get_logger(__name__)
+        self.sessions_dir = sessions_dir
+        self.fsync_policy = Config.HISTORY_FSYNC
+        self.fsync_interval = Config.HISTORY_FSYNC_INTERVAL
+        self.compact_threshold = Config.HISTORY_COMPACT_THRESHOLD
+
+        # 每个会话日志中的最新记录序号、快照之后的记录条数、上次 fsync 时间
+        self._log_seq: Dict[str, int] = {}
+        self._log_count: Dict[str, int] = {}
+        self._last_fsync: Dict[str, float] = {}
+        # 后台写入线程与请求线程会同时访问存储
+        self._lock = threading.RLock()
+
+        os.makedirs(self.sessions_dir, exist_ok=True)
+
+    def _snapshot_path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}{SNAPSHOT_SUFFIX}")
+
+    def _log_path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}{LOG_SUFFIX}")
+
+    def list_ids(self) -> List[str]:
+        """列出磁盘上的所有会话ID"""
+        return list(self.list_mtimes())
+
+    def list_mtimes(self) -> Dict[str, float]:
+        """列出所有会话及其文件的最后修改时间"""
+        mtimes: Dict[str, float] = {}
+        for entry in os.scandir(self.sessions_dir):
+            if entry.name.endswith(SNAPSHOT_SUFFIX):
+                session_id = entry.name[:-len(SNAPSHOT_SUFFIX)]
+            elif entry.name.endswith(LOG_SUFFIX):
+                session_id = entry.name[:-len(LOG_SUFFIX)]
+            else:
+                continue
+            mtimes[session_id] = max(mtimes.get(session_id, 0.0), entry.stat().st_mtime)
+        return mtimes
+
+    def mtime(self, session_id: str) -> float:
+        """会话文件的最后修改时间，会话不存在时返回 0"""
+        return max(
+            (os.path.getmtime(path) for path in (self._snapshot_path(session_id), self._log_path(session_id))
+             if os.path.exists(path)),
+            default=0.0
+        )
+
+    def exists(self, session_id: str) -> bool:
+        """会话是否存在于磁盘"""
+        return os.path.exists(self._snapshot_path(session_id)) or os.path.exists(self._log_path(session_id))
+
+    def load(self, session_id: str) -> List[Dict[str, Any]]:
+        """加载会话：快照 + 日志回放"""
+        with self._lock:
+            messages, _ = self._replay(session_id)
+        return messages
+
+    def write(self, session_id: str, records: List[Dict[str, Any]]):
+        """追加变更记录
+
+        记录格式：
+        - {'op': 'append', 'message': {...}}  追加一条消息
+        - {'op': 'trim', 'count': n}          删除最旧的 n 条非系统消息
+        - {'op': 'remove', 'seqs': [...]}     删除指定序号的消息（被替换的摘要）
+        - {'op': 'clear', 'last_seq': n}      清空会话（新会话以此创建空快照）
+        """
+        if not records:
+            return
+
+        with self._lock:
+            # 清空操作直接落为空快照，其后的记录继续追加
+            for index in range(len(records) - 1, -1, -1):
+                if records[index]['op'] == 'clear':
+                    self._write_snapshot(session_id, [], self._next_seq(session_id) - 1)
+                    self._truncate_log(session_id)
+                    records = records[index + 1:]
+                    break
+
+            if records:
+                self._append_log(session_id, records)
+
+            if self._log_count.get(session_id, 0) >= self.compact_threshold:
+                self.compact(session_id)
+
+    def restore(self, session_id: str, messages: List[Dict[str, Any]]):
+        """直接以完整消息列表写入快照，用于从归档恢复会话"""
+        with self._lock:
+            self._write_snapshot(session_id, messages, self._next_seq(session_id) - 1)
+            self._truncate_log(session_id)
+
+    def compact(self, session_id: str):
+        """将快照和日志合并为新的快照"""
+        with self._lock:
+            messages, log_seq = self._replay(session_id)
+            self._write_snapshot(session_id, messages, log_seq)
+            self._truncate_log(session_id)
+        self.logger.info(f"🗜️ 会话已压缩: {session_id}, 消息数量: {len(messages)}")
+
+    def delete(self, session_id: str):
+        """删除会话文件"""
+        with self._lock:
+            for file_path in (self._snapshot_path(session_id), self._log_path(session_id)):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    self.logger.info(f"🗑️ 删除会话文件: {file_path}")
+
+            self._log_seq.pop(session_id, None)
+            self._log_count.pop(session_id, None)
+            self._last_fsync.pop(session_id, None)
+
+    def _next_seq(self, session_id: str) -> int:
+        if session_id not in self._log_seq:
+            self._replay(session_id)
+        return self._log_seq.get(session_id, 0) + 1
+
+    def _append_log(self, session_id: str, records: List[Dict[str, Any]]):
+        seq = self._next_seq(session_id)
+        lines = []
+        for record in records:
+            lines.append(json.dumps(dict(record, seq=seq), ensure_ascii=False))
+            seq += 1
+
+        with open(self._log_path(session_id), 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            if self._should_fsync(session_id):
+                os.fsync(f.fileno())
+
+        self._log_seq[session_id] = seq - 1
+        self._log_count[session_id] = self._log_count.get(session_id, 0) + len(records)
+
+    def _should_fsync(self, session_id: str) -> bool:
+        if self.fsync_policy == 'always':
+            return True
+        if self.fsync_policy == 'interval':
+            now = time.monotonic()
+            if now - self._last_fsync.get(session_id, 0.0) >= self.fsync_interval:
+                self._last_fsync[session_id] = now
+                return True
+        return False
+
+    def _write_snapshot(self, session_id: str, messages: List[Dict[str, Any]], log_seq: int):
+        file_path = self._snapshot_path(session_id)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'log_seq': log_seq, 'messages': messages}, f, ensure_ascii=False, indent=2)
+            f.flush()
+            if self.fsync_policy != 'never':
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+        self._log_seq[session_id] = log_seq
+
+    def _truncate_log(self, session_id: str):
+        log_path = self._log_path(session_id)
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        self._log_count[session_id] = 0
+
+    def _read_snapshot(self, session_id: str) -> Tuple[List[Dict[str, Any]], int]:
+        file_path = self._snapshot_path(session_id)
+        if not os.path.exists(file_path):
+            return [], 0
+
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        # 兼容旧版本直接保存消息列表的会话文件
+        if isinstance(data, list):
+            return data, 0
+        return data.get('messages', []), data.get('log_seq', 0)
+
+    def _replay(self, session_id: str) -> Tuple[List[Dict[str, Any]], int]:
+        messages, log_seq = self._read_snapshot(session_id)
+        count = 0
+
+        log_path = self._log_path(session_id)
+        if os.path.exists(log_path):
+            with open(log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 写入中断导致的不完整尾行
+                        self.logger.warning(f"⚠️ 忽略损坏的日志记录: {session_id}")
+                        continue
+
+                    # 已合并进快照的记录（压缩过程中断时残留）
+                    if record.get('seq', 0) <= log_seq:
+                        continue
+
+                    apply_record(messages, record)
+                    log_seq = record['seq']
+                    count += 1
+
+        self._log_seq[session_id] = log_seq
+        self._log_count[session_id] = count
+        return messages, log_seq
+
+
+def apply_record(messages: List[Dict[str, Any]], record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """将一条变更记录应用到消息列表，返回被移除的消息"""
+    op = record['op']
+    removed = []
+    if op == 'append':
+        messages.append(record['message'])
+    elif op == 'trim':
+        drop = record['count']
+        kept = []
+        for message in messages:
+            if drop > 0 and message['role'] != 'system':
+                drop -= 1
+                removed.append(message)
+                continue
+            kept.append(message)
+        messages[:] = kept
+    elif op == 'remove':
+        seqs = set(record['seqs'])
+        removed = [message for message in messages if message['seq'] in seqs]
+        messages[:] = [message for message in messages if message['seq'] not in seqs]
+    elif op == 'clear':
+        removed = messages[:]
+        messages.clear()
+    return removed
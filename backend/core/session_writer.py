@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 会话后台写入模块
+
+将会话变更记录从请求线程转移到后台线程，按会话合并后批量写入存储。
+
+持久化模式：
+- sync      每次变更立即写入（与直接调用存储相同）
+- batched   后台线程按固定间隔批量写入
+- shutdown  仅在进程退出或显式 flush 时写入
+"""
+
+from typing import Callable, Dict, List, Any, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+import atexit
+import threading
+from utils.logger import get_logger
+
+DURABILITY_MODES = ('sync', 'batched', 'shutdown')
+
+
+class SessionWriter:
+    """会话变更的分组提交写入器"""
+
+    def __init__(self, store, mode: str = 'batched', interval: float = 0.05):
+        self.logger = get_logger(__name__)
+        if mode not in DURABILITY_MODES:
+            self.logger.warning(f"⚠️ 未知的持久化模式 {mode}，使用 batched")
+            mode = 'batched'
+
+        self.store = store
+        self.mode = mode
+        self.interval = interval
+
+        # 待写入的记录，按会话分组并保持提交顺序
+        self._pending: 'OrderedDict[str, List[Dict[str, Any]]]' = OrderedDict()
+        # 记录写入存储后执行的回调（例如更新会话索引），按会话分组并保持提交顺序
+        self._callbacks: Dict[str, List[Callable[[], None]]] = {}
+        self._pending_lock = threading.Lock()
+        # 保证同一时刻只有一个线程向存储写入
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        # 每次写入后调用的回调，例如节流保存会话索引
+        self._flush_hooks = []
+
+        self._thread = None
+        if self.mode == 'batched':
+            self._thread = threading.Thread(target=self._run, name='session-writer', daemon=True)
+            self._thread.start()
+
+        atexit.register(self.close)
+        self.logger.info(f"✍️ 会话写入器已启动 - 模式: {self.mode}")
+
+    def add_flush_hook(self, hook):
+        """注册写入完成后的回调"""
+        self._flush_hooks.append(hook)
+
+    def submit(self, session_id: str, records: List[Dict[str, Any]],
+               callback: Optional[Callable[[], None]] = None):
+        """提交一个会话的变更记录，callback 在这些记录写入存储后执行"""
+        if self.mode == 'sync' or self._closed:
+            with self._flush_lock:
+                if self._write(session_id, records) and callback is not None:
+                    self._run_callbacks([callback])
+                self._run_hooks()
+            return
+
+        with self._pending_lock:
+            pending = self._pending.setdefault(session_id, [])
+            # 清空之前的记录已无意义，直接丢弃；回调全部保留，按顺序执行后结果相同
+            for record in records:
+                if record['op'] == 'clear':
+                    pending.clear()
+                pending.append(record)
+            if callback is not None:
+                self._callbacks.setdefault(session_id, []).append(callback)
+
+    def flush(self, session_id: Optional[str] = None):
+        """立即写入待写记录；指定会话时只写入该会话"""
+        with self._flush_lock:
+            with self._pending_lock:
+                if session_id is None:
+                    batch = self._pending
+                    callbacks = self._callbacks
+                    self._pending = OrderedDict()
+                    self._callbacks = {}
+                elif session_id in self._pending:
+                    batch = {session_id: self._pending.pop(session_id)}
+                    callbacks = {session_id: self._callbacks.pop(session_id, [])}
+                else:
+                    batch = {}
+                    callbacks = {}
+
+            for pending_id, records in batch.items():
+                if self._write(pending_id, records):
+                    self._run_callbacks(callbacks.get(pending_id, []))
+            # 回调和钩子在写入锁内执行，保存的索引与存储内容一致
+            self._run_hooks()
+
+    @contextmanager
+    def hold(self):
+        """暂停写入直到退出上下文，期间存储内容和写入回调不会变化"""
+        with self._flush_lock:
+            yield
+
+    def delete(self, session_id: str):
+        """丢弃会话的待写记录并删除存储中的会话"""
+        with self._flush_lock:
+            with self._pending_lock:
+                self._pending.pop(session_id, None)
+                self._callbacks.pop(session_id, None)
+            self.store.delete(session_id)
+
+    def close(self):
+        """停止后台线程并写入所有剩余记录"""
+        if self._closed:
+            return
+
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self.logger.info("✍️ 会话写入器已关闭")
+
+    def _write(self, session_id: str, records: List[Dict[str, Any]]) -> bool:
+        try:
+            self.store.write(session_id, records)
+            return True
+        except Exception as e:
+            self.logger.error(f"❌ 保存会话失败: {session_id}, {str(e)}")
+            return False
+
+    def _run_callbacks(self, callbacks: List[Callable[[], None]]):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error(f"❌ 会话写入回调执行失败: {str(e)}")
+
+    def _run_hooks(self):
+        for hook in self._flush_hooks:
+            try:
+                hook()
+            except Exception as e:
+                self.logger.error(f"❌ 写入回调执行失败: {str(e)}")
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            if self._closed:
+                break
+            self.flush()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS SQLite 会话存储模块
+
+所有会话保存在同一个 SQLite 数据库中：
+- sessions  每个会话一行，维护消息数量、创建时间、最后更新时间、标题和大小
+- messages  每条消息一行，主键为 (session_id, seq)
+
+数据库使用 WAL 模式，读写互不阻塞，多个工作进程可以共用同一个数据库：
+- 消息序号以数据库为准，写入时与其他进程的序号冲突则顺延，并写回缓存中的消息
+- 每次写事务递增会话的 version，进程缓存会话前检查 version，被其他进程修改过则重新加载
+"""
+
+from typing import Dict, List, Any, Optional, Tuple
+import os
+import json
+import sqlite3
+import threading
+from config.settings import Config
+from core.session_index import SORT_FIELDS, make_title
+from utils.logger import get_logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    last_updated TEXT,
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    title TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessions_last_updated ON sessions (last_updated);
+CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions (created_at);
+"""
+
+# 旧版本数据库缺少的列
+MIGRATIONS = {
+    'title': 'ALTER TABLE sessions ADD COLUMN title TEXT',
+    'size': 'ALTER TABLE sessions ADD COLUMN size INTEGER NOT NULL DEFAULT 0',
+    'version': 'ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0'
+}
+
+SESSION_COLUMNS = ('session_id', 'message_count', 'created_at', 'last_updated', 'title', 'size', 'last_seq')
+
+class SqliteSessionStore:
+    """基于 SQLite 的会话存储"""
+
+    # 会话元数据可直接通过索引查询
+    supports_listing = True
+    # 可由多个进程共用，缓存的会话需要检查是否被其他进程修改
+    shared = True
+
+    def __init__(self, db_path: str):
+        self.logger = get_logger(__name__)
+        self.db_path = db_path
+        self._local = threading.local()
+        # 本进程缓存的会话对应的 version，与数据库不一致说明其他进程修改过该会话
+        self._versions: Dict[str, int] = {}
+        # 因序号冲突而顺延的消息 {会话ID: {原序号: 新序号}}，之后按原序号移除消息时换算
+        self._renumbered: Dict[str, Dict[int, int]] = {}
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._migrate()
+
+    def _migrate(self):
+        conn = self._connect()
+        # 先补齐旧表缺少的列，再创建依赖这些列的索引
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(sessions)')}
+        if columns:
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+        conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=' + ('FULL' if Config.HISTORY_FSYNC == 'always' else 'NORMAL'))
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    def list_ids(self) -> List[str]:
+        """列出所有会话ID"""
+        rows = self._connect().execute('SELECT session_id FROM sessions').fetchall()
+        return [row[0] for row in rows]
+
+    def exists(self, session_id: str) -> bool:
+        """会话是否存在"""
+        row = self._connect().execute(
+            'SELECT 1 FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def is_fresh(self, session_id: str) -> bool:
+        """本进程缓存的会话是否仍与数据库一致"""
+        row = self._connect().execute(
+            'SELECT version FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return (row[0] if row else 0) == self._versions.get(session_id, 0)
+
+    def load(self, session_id: str) -> List[Dict[str, Any]]:
+        """按顺序加载会话消息"""
+        conn = self._connect()
+        # 先读 version 再读消息，期间其他进程的写入最多导致下次多加载一次
+        row = conn.execute('SELECT version FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+        self._versions[session_id] = row[0] if row else 0
+        self._renumbered.pop(session_id, None)
+        rows = conn.execute(
+            'SELECT message FROM messages WHERE session_id = ? ORDER BY seq', (session_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def write(self, session_id: str, records: List[Dict[str, Any]]):
+        """在一个事务中应用变更记录，记录格式与 JsonSessionStore.write 相同
+
+        追加的消息序号以数据库为准，与其他进程冲突时顺延并写回记录中的消息（即缓存中的同一对象）。
+        """
+        if not records:
+            return
+
+        with self._transaction() as conn:
+            conn.execute('INSERT OR IGNORE INTO sessions (session_id) VALUES (?)', (session_id,))
+            version = conn.execute(
+                'SELECT version FROM sessions WHERE session_id = ?', (session_id,)
+            ).fetchone()[0]
+            conn.execute('UPDATE sessions SET version = ? WHERE session_id = ?', (version + 1, session_id))
+            for record in records:
+                op = record['op']
+                if op == 'append':
+                    self._append(conn, session_id, record['message'])
+                elif op == 'trim':
+                    self._trim(conn, session_id, record['count'])
+                elif op == 'remove':
+                    self._remove(conn, session_id, record['seqs'])
+                elif op == 'clear':
+                    self._renumbered.pop(session_id, None)
+                    conn.execute('DELETE FROM messages WHERE session_id = ?', (session_id,))
+                    conn.execute(
+                        'UPDATE sessions SET message_count = 0, size = 0, created_at = NULL, '
+                        'last_updated = NULL, title = NULL, last_seq = MAX(last_seq, ?) WHERE session_id = ?',
+                        (record.get('last_seq', 0), session_id)
+                    )
+
+        # 写入前的 version 与缓存的不同说明其他进程修改过该会话，保持不一致使缓存重新加载
+        if version == self._versions.get(session_id, 0):
+            self._versions[session_id] = version + 1
+
+    def _append(self, conn: sqlite3.Connection, session_id: str, message: Dict[str, Any]):
+        last_seq = conn.execute(
+            'SELECT last_seq FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()[0]
+        # HistoryManager 按缓存分配序号；数据库中已有更大的序号时（其他进程写入或手工导入的数据）顺延
+        seq = max(message.get('seq', 0), last_seq + 1)
+        if message.get('seq') != seq:
+            if 'seq' in message:
+                self._renumbered.setdefault(session_id, {})[message['seq']] = seq
+            message['seq'] = seq
+        data = json.dumps(message, ensure_ascii=False)
+        title = make_title(message['content']) if message['role'] == 'user' else None
+        conn.execute(
+            'INSERT INTO messages (session_id, seq, role, message) VALUES (?, ?, ?, ?)',
+            (session_id, seq, message['role'], data)
+        )
+        conn.execute(
+            'UPDATE sessions SET last_seq = ?, message_count = message_count + 1, size = size + ?, '
+            'created_at = COALESCE(created_at, ?), last_updated = ?, title = COALESCE(title, ?) '
+            'WHERE session_id = ?',
+            (seq, len(data), message.get('timestamp'), message.get('timestamp'), title, session_id)
+        )
+
+    def _trim(self, conn: sqlite3.Connection, session_id: str, count: int):
+        # 与 apply_record 保持一致：删除最旧的 count 条非系统消息
+        rows = conn.execute(
+            "SELECT seq, length(message) FROM messages WHERE session_id = ? AND role != 'system' "
+            'ORDER BY seq LIMIT ?',
+            (session_id, count)
+        ).fetchall()
+        if not rows:
+            return
+        conn.executemany(
+            'DELETE FROM messages WHERE session_id = ? AND seq = ?',
+            [(session_id, row[0]) for row in rows]
+        )
+        conn.execute(
+            'UPDATE sessions SET message_count = message_count - ?, size = size - ? WHERE session_id = ?',
+            (len(rows), sum(row[1] for row in rows), session_id)
+        )
+
+    def _remove(self, conn: sqlite3.Connection, session_id: str, seqs: List[int]):
+        renumbered = self._renumbered.get(session_id, {})
+        seqs = [renumbered.get(seq, seq) for seq in seqs]
+        rows = conn.execute(
+            f"SELECT seq, length(message) FROM messages WHERE session_id = ? AND seq IN ({','.join('?' * len(seqs))})",
+            (session_id, *seqs)
+        ).fetchall()
+        if not rows:
+            return
+        conn.executemany(
+            'DELETE FROM messages WHERE session_id = ? AND seq = ?',
+            [(session_id, row[0]) for row in rows]
+        )
+        conn.execute(
+            'UPDATE sessions SET message_count = message_count - ?, size = size - ? WHERE session_id = ?',
+            (len(rows), sum(row[1] for row in rows), session_id)
+        )
+
+    def delete(self, session_id: str):
+        """删除会话及其消息"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM messages WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+        self._versions.pop(session_id, None)
+        self._renumbered.pop(session_id, None)
+        self.logger.info(f"🗑️ 删除会话: {session_id}")
+
+    def get_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """查询单个会话的元数据"""
+        row = self._connect().execute(
+            f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return dict(zip(SESSION_COLUMNS, row)) if row is not None else None
+
+    def list_sessions(self, sort_by: str = 'last_updated', order: str = 'desc',
+                      offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """排序分页查询会话元数据，返回 (当前页, 总数)"""
+        if sort_by not in SORT_FIELDS:
+            raise ValueError(f"不支持的排序字段: {sort_by}")
+        direction = 'DESC' if order == 'desc' else 'ASC'
+
+        conn = self._connect()
+        total = conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions "
+            f'ORDER BY {sort_by} {direction}, session_id LIMIT ? OFFSET ?',
+            (-1 if limit is None else limit, offset)
+        ).fetchall()
+        return [dict(zip(SESSION_COLUMNS, row)) for row in rows], total
+
+
+class _Transaction:
+    """写事务：BEGIN IMMEDIATE 获取写锁，异常时回滚"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
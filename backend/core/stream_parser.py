@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 流式标签解析模块
+
+逐段接收 LLM 输出，在 </tool_call> 或 </final_answer> 闭合的瞬间识别出来，
+调用方据此立即中断生成并执行工具，不再为标签之后的多余内容等待和付费。
+
+一次响应可以包含多个连续的 <tool_call>：工具调用闭合后，若紧接着（忽略空白）
+开始下一个 <tool_call> 则继续接收，出现其他内容时结束。
+"""
+
+from typing import Dict, Optional
+
+TOOL_CALL = 'tool_call'
+FINAL_ANSWER = 'final_answer'
+TAGS = (TOOL_CALL, FINAL_ANSWER)
+OPEN_TOOL_CALL = f'<{TOOL_CALL}>'
+
+# 非流式请求传给 LLM 的停止序列；</tool_call> 之后可能还有下一个工具调用，不能作为停止序列
+STOP_SEQUENCES = [f'</{FINAL_ANSWER}>']
+
+# 标签可能跨越两个片段，每次从末尾回退该长度开始查找
+_MAX_TAG_LENGTH = max(len(f'</{tag}>') for tag in TAGS)
+
+
+class TagStreamParser:
+    """增量识别响应中闭合的工具调用和最终答案标签"""
+
+    def __init__(self):
+        self.text = ''
+        # 已闭合的标签名，未闭合时为 None
+        self.closed: Optional[str] = None
+        # 已出现的开始标签位置
+        self._opened: Dict[str, int] = {}
+        self._scan_from = 0
+        # 已经返回给调用方的文本长度
+        self._emitted = 0
+        # 最近一个 </tool_call> 的结束位置，等待判断后面是否紧跟下一个工具调用
+        self._pending: Optional[int] = None
+
+    def feed(self, delta: str) -> str:
+        """追加一段文本，返回其中可以确定保留的部分；标签闭合后的内容被丢弃"""
+        if self.closed:
+            return ''
+
+        self.text += delta
+        self._scan()
+        return self._emit()
+
+    def finish(self) -> str:
+        """生成结束时调用，返回尚未返回的剩余文本"""
+        if not self.closed and self._pending is not None:
+            self._close(TOOL_CALL, self._pending)
+        return self._emit()
+
+    def _emit(self) -> str:
+        # 工具调用之后的空白或不完整的开始标签先保留，确定后再返回
+        end = len(self.text) if self._pending is None else self._pending
+        text = self.text[self._emitted:end]
+        self._emitted = end
+        return text
+
+    def _close(self, tag: str, end: int):
+        self.closed = tag
+        self.text = self.text[:end]
+        self._pending = None
+
+    def _scan(self):
+        while not self.closed:
+            if self._pending is not None:
+                rest = self.text[self._pending:].lstrip()
+                if OPEN_TOOL_CALL.startswith(rest):
+                    # 还无法判断，等待更多内容
+                    return
+                if not rest.startswith(OPEN_TOOL_CALL):
+                    self._close(TOOL_CALL, self._pending)
+                    return
+
+                # 紧跟下一个工具调用，继续查找它的闭合标签
+                self._opened.pop(TOOL_CALL, None)
+                self._scan_from = self._pending
+                self._pending = None
+                continue
+
+            match = self._find_closing()
+            if match is None:
+                self._scan_from = max(self._scan_from, len(self.text) - _MAX_TAG_LENGTH + 1)
+                return
+
+            end, tag = match
+            if tag == FINAL_ANSWER:
+                self._close(tag, end)
+                return
+            self._pending = self._scan_from = end
+
+    def _find_closing(self):
+        """查找最早出现的、位于对应开始标签之后的闭合标签，返回 (结束位置, 标签名)"""
+        match = None
+        for tag in TAGS:
+            if tag not in self._opened:
+                index = self.text.find(f'<{tag}>', self._scan_from)
+                if index == -1:
+                    continue
+                self._opened[tag] = index
+
+            closing = f'</{tag}>'
+            index = self.text.find(closing, max(self._scan_from, self._opened[tag]))
+            if index != -1 and (match is None or index < match[0]):
+                match = (index, index + len(closing), tag)
+        return match[1:] if match else None
+
+
+def complete_stopped(text: str) -> str:
+    """补全被停止序列截掉的闭合标签"""
+    for tag in TAGS:
+        if text.rfind(f'<{tag}>') > text.rfind(f'</{tag}>'):
+            return f'{text}</{tag}>'
+    return text
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 对话摘要模块
+
+会话中未被摘要的消息超过 token 阈值时，把较早的部分连同之前的摘要一起交给 LLM
+压缩成新的摘要，作为固定的系统消息写入历史记录并替换之前的摘要。原始消息仍保留在历史记录中供接口查询，
+但发送给 LLM 时只使用摘要和摘要之后的消息。
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import Config
+from utils.logger import get_logger
+from .prompts import get_summary_prompt
+
+SUMMARY_TYPE = 'summary'
+SUMMARY_HEADER = '以下是之前对话的摘要：\n'
+# 交给摘要模型的单条消息最大字符数，超长的工具结果截断
+MESSAGE_CHAR_LIMIT = 4000
+ROLE_NAMES = {'user': '用户', 'assistant': '助手', 'system': '系统'}
+
+
+def split_summarized(history: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """返回 (最新的摘要消息, 摘要之后尚未被摘要的消息)"""
+    summary = None
+    for message in reversed(history):
+        if message.get('type') == SUMMARY_TYPE:
+            summary = message
+            break
+
+    upto = summary['summary_upto'] if summary else 0
+    rest = [
+        message for message in history
+        if message['seq'] > upto and message.get('type') != SUMMARY_TYPE
+    ]
+    return summary, rest
+
+
+class ConversationSummarizer:
+    """滚动压缩会话历史"""
+
+    def __init__(self, llm_client, history_manager):
+        self.logger = get_logger(__name__)
+        self.llm_client = llm_client
+        self.history_manager = history_manager
+        self.trigger_tokens = Config.SUMMARY_TRIGGER_TOKENS
+        self.keep_tokens = Config.SUMMARY_KEEP_TOKENS
+        self.model = Config.SUMMARY_MODEL or llm_client.model
+
+    async def acompact(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """未摘要的历史超过阈值时生成新的摘要，返回写入的摘要消息，无需压缩或失败时返回 None"""
+        if self.trigger_tokens <= 0:
+            return None
+
+        # 读取历史和分词在历史记录线程池中执行，不阻塞共享事件循环
+        plan = await self.history_manager.arun(self._plan, session_id)
+        if plan is None:
+            return None
+        summary, older, costs = plan
+
+        self.logger.info(f"🗜️ 压缩会话历史 - 会话: {session_id}, 消息数量: {len(older)}, token 数: {sum(costs[:len(older)])}")
+        try:
+            text = await self.llm_client.achat(
+                get_summary_prompt(),
+                [{'role': 'user', 'content': self._build_request(summary, older)}],
+                model=self.model
+            )
+        except Exception as e:
+            self.logger.error(f"❌ 生成对话摘要失败: {str(e)}")
+            return None
+
+        return await self.history_manager.aadd_message(
+            session_id,
+            'system',
+            f"{SUMMARY_HEADER}{text.strip()}",
+            # 新摘要已合并旧摘要的内容，旧摘要不再保留
+            replaces=SUMMARY_TYPE,
+            type=SUMMARY_TYPE,
+            summary_upto=older[-1]['seq']
+        )
+
+    def _plan(self, session_id: str) -> Optional[Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]], List[int]]]:
+        """返回 (当前摘要, 需要摘要的消息, 未摘要消息的 token 数)，未超过阈值时返回 None"""
+        summary, rest = split_summarized(self.history_manager.get_history(session_id))
+        counter = self.llm_client.tokens
+        costs = [
+            counter.count_message(message, (session_id, message['seq'], message.get('timestamp')))
+            for message in rest
+        ]
+        if sum(costs) <= self.trigger_tokens:
+            return None
+
+        older = rest[:self._split_point(rest, costs)]
+        if not older:
+            return None
+        return summary, older, costs
+
+    def _split_point(self, messages: List[Dict[str, Any]], costs: List[int]) -> int:
+        """从最新的消息往前保留 keep_tokens 以内的部分，返回需要摘要的消息数量"""
+        kept = 0
+        cut = len(messages)
+        while cut > 0 and kept + costs[cut - 1] <= self.keep_tokens:
+            cut -= 1
+            kept += costs[cut]
+
+        # 最新一条消息总是原样保留，保留部分尽量从用户消息开始，避免拆开同一轮对话
+        cut = min(cut, len(messages) - 1)
+        for index in range(cut, len(messages)):
+            if messages[index]['role'] == 'user':
+                return index
+        return cut
+
+    def _build_request(self, summary: Optional[Dict[str, Any]], messages: List[Dict[str, Any]]) -> str:
+        """组装交给摘要模型的内容"""
+        lines = []
+        for message in messages:
+            content = message['content']
+            if isinstance(content, list):
+                text = ' '.join(
+                    part.get('text', '') if part.get('type') == 'text' else '[图片]'
+                    for part in content
+                )
+            else:
+                text = str(content)
+            if len(text) > MESSAGE_CHAR_LIMIT:
+                text = text[:MESSAGE_CHAR_LIMIT] + '…（已截断）'
+            lines.append(f"{ROLE_NAMES.get(message['role'], message['role'])}: {text}")
+
+        transcript = '\n\n'.join(lines)
+        if summary:
+            previous = summary['content'][len(SUMMARY_HEADER):] if summary['content'].startswith(SUMMARY_HEADER) else summary['content']
+            return f"之前的摘要：\n{previous}\n\n需要合并的新对话：\n{transcript}"
+        return f"需要压缩的对话：\n{transcript}"
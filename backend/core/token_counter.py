@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS Token 计数模块
+
+优先使用 tiktoken 在本地精确计数；未安装或无法加载编码时退回按字符估算
+（中日韩字符约 1 个 token，其他字符约 4 个一个 token）。
+历史消息写入后不再变化，每条消息的计数结果按 (会话ID, 序号, 时间戳) 缓存。
+"""
+
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from collections import OrderedDict
+import re
+import threading
+from utils.logger import get_logger
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 每条消息的角色和分隔符开销，以及回复的起始开销
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+# 单张图片按高清模式的典型开销计算
+IMAGE_TOKENS = 765
+
+_CJK_PATTERN = re.compile(r'[⺀-鿿가-힯豈-﫿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """不依赖分词器估算文本的 token 数"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class TokenCounter:
+    """按模型计数消息 token 的计数器"""
+
+    def __init__(self, model: str, cache_size: int = 50000):
+        self.logger = get_logger(__name__)
+        self.encoding = self._load_encoding(model)
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[Hashable, int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load_encoding(self, model: str):
+        """加载模型对应的编码，失败时返回 None 使用估算"""
+        if tiktoken is None:
+            self.logger.info("📏 未安装 tiktoken，按字符数估算 token")
+            return None
+        try:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                # 非 OpenAI 模型使用通用编码
+                return tiktoken.get_encoding('cl100k_base')
+        except Exception as e:
+            self.logger.warning(f"⚠️ 加载 tiktoken 编码失败，按字符数估算 token: {str(e)}")
+            return None
+
+    def count_text(self, text: str) -> int:
+        """计数一段文本"""
+        if not text:
+            return 0
+        if self.encoding is None:
+            return estimate_tokens(text)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_content(self, content: Any) -> int:
+        """计数消息内容，多模态内容中的图片按固定开销计算"""
+        if isinstance(content, list):
+            total = 0
+            for part in content:
+                if part.get('type') == 'image_url':
+                    total += IMAGE_TOKENS
+                else:
+                    total += self.count_text(part.get('text', ''))
+            return total
+        return self.count_text(str(content))
+
+    def count_message(self, message: Dict[str, Any], key: Optional[Hashable] = None) -> int:
+        """计数单条消息（含角色开销），提供 key 时缓存结果"""
+        if key is not None:
+            with self._lock:
+                tokens = self._cache.get(key)
+                if tokens is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return tokens
+                self.misses += 1
+
+        tokens = self.count_content(message.get('content', '')) + MESSAGE_OVERHEAD
+
+        if key is not None:
+            with self._lock:
+                self._cache[key] = tokens
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return tokens
+
+    def fit(self, messages: List[Dict[str, Any]], budget: int,
+            keys: Optional[List[Hashable]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """在预算内选取消息，返回 (按原顺序排列的消息, 消息 token 数)
+
+        先从最新的消息开始连续装入，装不下时停止，保证最近的对话完整；
+        剩余预算再按从新到旧装入更早的系统消息（工具结果、会话摘要等固定内容）。
+        最新一条消息无论多长都会保留。
+        """
+        costs = [
+            self.count_message(message, keys[index] if keys else None)
+            for index, message in enumerate(messages)
+        ]
+
+        selected = set()
+        used = 0
+        start = len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            if selected and used + costs[index] > budget:
+                break
+            selected.add(index)
+            used += costs[index]
+            start = index
+
+        for index in range(start - 1, -1, -1):
+            if messages[index]['role'] == 'system' and used + costs[index] <= budget:
+                selected.add(index)
+                used += costs[index]
+
+        return [message for index, message in enumerate(messages) if index in selected], used
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取计数缓存统计"""
+        with self._lock:
+            return {
+                'tokenizer': self.encoding.name if self.encoding is not None else 'estimate',
+                'cached_messages': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -5,11 +5,17 @@ APOS 工具基类
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, Optional
 
 class BaseTool(ABC):
     """工具基类"""
     
+    # 结果缓存：声明为可缓存的工具，相同参数的调用在 cache_ttl 秒内直接返回上次的结果
+    cacheable = False
+    cache_ttl = 300.0
+    # 发送给 LLM 的结果最大字符数，超出部分存入结果存储；None 使用全局配置，0 表示不限制
+    result_max_chars = None
+    
     def __init__(self):
         self.name = self.__class__.__name__.replace('Tool', '').lower()
     
@@ -27,6 +33,10 @@ class BaseTool(ABC):
         """获取工具参数定义"""
         return {}
     
+    def get_cache_version(self, parameters: Dict[str, Any]) -> Optional[Hashable]:
+        """返回本次调用结果所依赖的外部状态版本，版本变化时缓存失效；返回 None 表示本次调用不缓存"""
+        return 0 if self.cacheable else None
+    
     def validate_parameters(self, parameters: Dict[str, Any], required: list = None) -> bool:
         """验证参数"""
         if required:
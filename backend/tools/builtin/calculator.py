@@ -13,6 +13,10 @@ from utils.logger import get_logger
 class CalculatorTool(BaseTool):
     """计算器工具"""
     
+    # 相同表达式的结果不变
+    cacheable = True
+    cache_ttl = 24 * 3600.0
+    
     def __init__(self):
         super().__init__()
         self.logger = get_logger(__name__)
@@ -5,13 +5,17 @@ APOS 文件操作工具
 """
 
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, Optional
 from tools.base_tool import BaseTool
 from utils.logger import get_logger
 
 class FileOperationsTool(BaseTool):
     """文件操作工具"""
     
+    # 只缓存读取操作，文件修改时间或大小变化时缓存失效
+    cacheable = True
+    cache_ttl = 300.0
+    
     def __init__(self):
         super().__init__()
         self.logger = get_logger(__name__)
@@ -43,6 +47,16 @@ class FileOperationsTool(BaseTool):
                 'operation': operation
             }
     
+    def get_cache_version(self, parameters: Dict[str, Any]) -> Optional[Hashable]:
+        """读取操作以文件的 (修改时间, 大小) 作为缓存版本，其他操作不缓存"""
+        if parameters.get('operation') != 'read' or 'path' not in parameters:
+            return None
+        try:
+            stat = os.stat(parameters['path'])
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
     def _read_file(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """读取文件"""
         self.validate_parameters(parameters, ['path'])
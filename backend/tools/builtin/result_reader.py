@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 工具结果分页读取工具
+"""
+
+from typing import Dict, Any
+from config.settings import Config
+from core.blob_store import BlobStore, DIGEST_PATTERN
+from tools.base_tool import BaseTool
+from utils.logger import get_logger
+
+class ResultReaderTool(BaseTool):
+    """分页读取超长工具结果"""
+
+    # 完整结果按内容哈希保存，引用对应的内容不会变化
+    cacheable = True
+    cache_ttl = 3600.0
+    # 每页长度已受限制，不再按结果预算截断
+    result_max_chars = 0
+
+    def __init__(self):
+        super().__init__()
+        self.logger = get_logger(__name__)
+        self.store = BlobStore()
+        self.page_chars = max(1, Config.TOOL_RESULT_PAGE_CHARS)
+
+    def execute(self, parameters: Dict[str, Any]) -> Any:
+        """读取完整结果的一页"""
+        self.validate_parameters(parameters, ['ref'])
+
+        ref = str(parameters['ref']).strip()
+
+        self.logger.info(f"📖 读取工具结果: {ref}")
+
+        try:
+            offset = max(0, int(parameters.get('offset', 0)))
+            length = min(max(1, int(parameters.get('length', self.page_chars))), self.page_chars)
+
+            data = self.store.get(ref) if DIGEST_PATTERN.match(ref) else None
+            if data is None:
+                raise ValueError(f"结果不存在: {ref}")
+
+            text = data.decode('utf-8')
+            content = text[offset:offset + length]
+            end = offset + len(content)
+
+            return {
+                'ref': ref,
+                'offset': offset,
+                'length': len(content),
+                'total_chars': len(text),
+                'content': content,
+                'next_offset': end if end < len(text) else None
+            }
+
+        except Exception as e:
+            self.logger.error(f"❌ 读取工具结果失败: {str(e)}")
+            return {
+                'error': f'读取工具结果失败: {str(e)}',
+                'ref': ref
+            }
+
+    def get_description(self) -> str:
+        """获取工具描述"""
+        return "分页读取因过长被截断的工具结果，传入截断结果中的 ref 和 next_offset 继续读取"
+
+    def get_parameters(self) -> Dict[str, Any]:
+        """获取工具参数定义"""
+        return {
+            'ref': {
+                'type': 'string',
+                'description': '截断结果中的 ref',
+                'required': True
+            },
+            'offset': {
+                'type': 'integer',
+                'description': '起始字符位置，取截断结果或上一页的 next_offset',
+                'default': 0,
+                'required': False
+            },
+            'length': {
+                'type': 'integer',
+                'description': f'读取的字符数，最多 {Config.TOOL_RESULT_PAGE_CHARS}',
+                'default': Config.TOOL_RESULT_PAGE_CHARS,
+                'required': False
+            }
+        }
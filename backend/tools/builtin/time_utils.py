@@ -6,13 +6,17 @@ APOS 时间工具
 
 from datetime import datetime, timedelta
 import pytz
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, Optional
 from tools.base_tool import BaseTool
 from utils.logger import get_logger
 
 class TimeUtilsTool(BaseTool):
     """时间工具"""
     
+    # 除获取当前时间外，其余操作只依赖参数
+    cacheable = True
+    cache_ttl = 24 * 3600.0
+    
     def __init__(self):
         super().__init__()
         self.logger = get_logger(__name__)
@@ -46,6 +50,12 @@ class TimeUtilsTool(BaseTool):
                 'operation': operation
             }
     
+    def get_cache_version(self, parameters: Dict[str, Any]) -> Optional[Hashable]:
+        """获取当前时间的结果不缓存"""
+        if parameters.get('operation') == 'current_time':
+            return None
+        return 0
+    
     def _get_current_time(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """获取当前时间"""
         timezone = parameters.get('timezone', 'Asia/Shanghai')
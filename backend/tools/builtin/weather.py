@@ -12,6 +12,9 @@ from utils.logger import get_logger
 class WeatherTool(BaseTool):
     """天气工具"""
     
+    cacheable = True
+    cache_ttl = 600.0
+    
     def __init__(self):
         super().__init__()
         self.logger = get_logger(__name__)
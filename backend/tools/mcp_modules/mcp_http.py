@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MCP streamable-http 客户端模块
+
+按 MCP streamable-http 传输规范与服务器通信：首次请求前完成 initialize 握手，
+之后的请求携带服务器分配的 Mcp-Session-Id；响应可以是 JSON 或 SSE 事件流。
+每个服务器共用一个保持连接的 httpx.AsyncClient，多个请求以递增的 JSON-RPC id 并发发送。
+"""
+
+from typing import Any, Dict, List, Optional
+import asyncio
+import itertools
+import json
+from utils.logger import get_logger
+
+PROTOCOL_VERSION = '2025-03-26'
+CLIENT_INFO = {'name': 'APOS', 'version': '1.0.0'}
+
+
+class MCPHttpError(Exception):
+    """MCP 服务器返回的 JSON-RPC 错误"""
+
+
+class SessionExpired(Exception):
+    """服务器不再识别当前会话ID"""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"MCP 会话已失效: {session_id}")
+        self.session_id = session_id
+
+
+class MCPHttpClient:
+    """一个 streamable-http MCP 服务器的客户端，方法需在 mcp_runner 的事件循环中调用"""
+
+    def __init__(self, server_name: str, url: str, max_connections: int = 4, timeout: float = 30.0):
+        self.logger = get_logger(__name__)
+        self.server_name = server_name
+        self.url = url
+        self.max_connections = max(1, max_connections)
+        self.timeout = timeout
+
+        self._client = None
+        self._ids = itertools.count(1)
+        self._session_id: Optional[str] = None
+        self._protocol_version = PROTOCOL_VERSION
+        # 握手结果，多个并发请求等待同一次握手，会话失效时重置为 None
+        self._initialized: Optional[asyncio.Future] = None
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def client(self):
+        """共享的 HTTP 客户端，连接在请求之间保持"""
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                # 连接池排队由工具调用超时控制
+                timeout=httpx.Timeout(self.timeout, pool=None),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        """获取服务器的全部工具，按 nextCursor 翻页"""
+        tools = []
+        cursor = None
+        while True:
+            result = await self.request('tools/list', {'cursor': cursor} if cursor else {})
+            tools.extend(result.get('tools', []))
+            cursor = result.get('nextCursor')
+            if not cursor:
+                return tools
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """调用工具，返回 {content, isError}"""
+        return await self.request('tools/call', {'name': tool_name, 'arguments': arguments})
+
+    async def request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """发送请求并返回 result，会话失效时重新握手后重试一次"""
+        await self._ensure_initialized()
+        self.requests += 1
+        try:
+            try:
+                return await self._send(method, params)
+            except SessionExpired as e:
+                # 并发请求同时发现会话失效时只重新握手一次
+                if self._session_id == e.session_id:
+                    self.logger.info(f"🔄 MCP 会话已失效，重新初始化: {self.server_name}")
+                    self._initialized = None
+                    self._session_id = None
+                await self._ensure_initialized()
+                try:
+                    return await self._send(method, params)
+                except SessionExpired:
+                    raise RuntimeError(f"MCP 服务器在重新初始化后仍拒绝会话: {self.server_name}") from None
+        except Exception:
+            self.failures += 1
+            raise
+
+    async def _ensure_initialized(self):
+        if self._initialized is None:
+            self._initialized = asyncio.ensure_future(self._initialize())
+        initialized = self._initialized
+        try:
+            await asyncio.shield(initialized)
+        except Exception:
+            # 握手失败时下次请求重新握手
+            if self._initialized is initialized:
+                self._initialized = None
+            raise
+
+    async def _initialize(self):
+        """initialize 握手，记录服务器分配的会话ID和协商的协议版本"""
+        result = await self._send('initialize', {
+            'protocolVersion': PROTOCOL_VERSION,
+            'capabilities': {},
+            'clientInfo': CLIENT_INFO
+        })
+        self._protocol_version = result.get('protocolVersion', PROTOCOL_VERSION)
+        await self._post({'jsonrpc': '2.0', 'method': 'notifications/initialized'})
+        self.logger.info(f"🔌 MCP HTTP 会话已建立: {self.server_name}, 会话ID: {self._session_id}")
+
+    async def _send(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """发送一个 JSON-RPC 请求并等待对应 id 的响应"""
+        request_id = next(self._ids)
+        message = await self._post({'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params})
+        if message is None:
+            raise RuntimeError(f"未收到请求 {method} 的响应")
+        if 'error' in message:
+            raise MCPHttpError(message['error'].get('message', '未知错误'))
+        return message.get('result', {})
+
+    async def _post(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """POST 一条消息；请求返回对应 id 的响应消息，通知返回 None"""
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json, text/event-stream',
+            'MCP-Protocol-Version': self._protocol_version
+        }
+        if self._session_id:
+            headers['Mcp-Session-Id'] = self._session_id
+
+        async with self.client.stream('POST', self.url, json=message, headers=headers) as response:
+            if response.status_code in (400, 404) and 'Mcp-Session-Id' in headers and 'id' in message:
+                await response.aread()
+                error = _jsonrpc_error(response.text)
+                # 规范要求对失效会话返回 404，部分服务器实现返回不带 JSON-RPC 错误的 400；
+                # 带 JSON-RPC 错误的 400 是请求本身有误，会话仍然有效
+                if response.status_code == 404 or error is None:
+                    raise SessionExpired(headers['Mcp-Session-Id'])
+                return {'jsonrpc': '2.0', 'id': message['id'], 'error': error}
+            if response.status_code >= 400:
+                await response.aread()
+                raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+            session_id = response.headers.get('mcp-session-id')
+            if session_id:
+                self._session_id = session_id
+            if 'id' not in message:
+                return None
+
+            content_type = response.headers.get('content-type', '')
+            if content_type.startswith('text/event-stream'):
+                async for data in iter_sse_data(response):
+                    reply = _match_response(data, message['id'])
+                    if reply is not None:
+                        return reply
+                return None
+
+            await response.aread()
+            return _match_response(response.text, message['id'])
+
+    async def aclose(self):
+        """结束服务器会话并关闭连接"""
+        if self._client is None:
+            return
+        try:
+            if self._session_id:
+                await self._client.delete(self.url, headers={'Mcp-Session-Id': self._session_id})
+        except Exception as e:
+            self.logger.warning(f"⚠️ 结束 MCP HTTP 会话失败 {self.server_name}: {str(e)}")
+        finally:
+            await self._client.aclose()
+            self._client = None
+            self._session_id = None
+            self._initialized = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'transport': 'streamable-http',
+            'session_id': self._session_id,
+            'requests': self.requests,
+            'failures': self.failures
+        }
+
+
+async def iter_sse_data(response):
+    """逐个产出 SSE 事件的 data 内容，多行 data 以换行连接"""
+    data_lines = []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield '\n'.join(data_lines)
+                data_lines = []
+            continue
+        if line.startswith(':'):
+            continue
+        field, _, value = line.partition(':')
+        if field == 'data':
+            data_lines.append(value[1:] if value.startswith(' ') else value)
+    if data_lines:
+        yield '\n'.join(data_lines)
+
+
+def _match_response(data: str, request_id: int) -> Optional[Dict[str, Any]]:
+    """从 JSON 文本（单条消息或批量消息）中找出对应 id 的响应，忽略服务器发来的通知和请求"""
+    if not data.strip():
+        return None
+    payload = json.loads(data)
+    messages = payload if isinstance(payload, list) else [payload]
+    for message in messages:
+        if message.get('id') == request_id and ('result' in message or 'error' in message):
+            return message
+    return None
+
+
+def _jsonrpc_error(data: str) -> Optional[Dict[str, Any]]:
+    """解析错误响应中的 JSON-RPC error 对象，响应体不是 JSON-RPC 错误时返回 None"""
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return None
+    if isinstance(payload, dict) and isinstance(payload.get('error'), dict):
+        return payload['error']
+    return None
@@ -6,10 +6,15 @@ MCP工具加载器模块
 
 import json
 import os
+import time
 import asyncio
+import hashlib
 from typing import Dict, List, Any
+from config.settings import Config
+from utils.async_runner import mcp_runner
 from utils.logger import get_logger
 from mcp import StdioServerParameters
+from .mcp_pool import session_pool
 from .mcp_tool import MCPToolWrapper
 
 
@@ -20,6 +25,20 @@ class MCPLoader:
         self.logger = get_logger(__name__)
         self.tool_manager = tool_manager
         self.mcp_dir = os.path.join(os.path.dirname(__file__), "..", "mcp")
+        self.cache_path = Config.MCP_TOOL_CACHE_PATH or os.path.join(
+            os.path.dirname(__file__), "..", "..", "cache", "mcp_tools.json"
+        )
+        # 各服务器工具列表的状态和已注册的工具名
+        self.server_status: Dict[str, Dict[str, Any]] = {}
+        self.server_tools: Dict[str, set] = {}
+        # 后台刷新工具列表的任务
+        self.refresh_future = None
+        self.servers: Dict[str, Dict[str, Any]] = {}
+        self.cache_entries: Dict[str, Any] = {}
+        self._refreshing = set()
+        # 延迟启动：有缓存的 stdio 服务器在首次调用工具时才启动
+        self.lazy_start = Config.MCP_LAZY_START
+        session_pool.on_start(self._on_server_started)
 
         # 确保MCP目录存在
         if not os.path.exists(self.mcp_dir):
@@ -27,9 +46,49 @@ class MCPLoader:
             self.logger.info("📁 创建 MCP 工具目录")
 
     def load_mcp_tools(self) -> None:
-        """加载所有MCP工具"""
+        """加载所有MCP工具
+
+        配置中声明了工具列表或有缓存的服务器直接注册，启动过程不等待 MCP 服务器。
+        延迟启动模式下，这些 stdio 服务器在首次调用其工具时才启动，启动后在后台刷新工具列表；
+        其余服务器在后台获取工具列表后注册。
+        """
+        servers = self._read_server_configs()
+        self.servers = servers
+        self.cache_entries = self._load_cache()
+
+        refresh = {}
+        for server_name, server_config in servers.items():
+            config_hash = self._config_hash(server_config)
+            declared = server_config.get('tools')
+            entry = self.cache_entries.get(config_hash)
+            status = {'config_hash': config_hash, 'tool_count': 0, 'fetched_at': None, 'error': None}
+
+            if declared:
+                # 配置中声明的工具列表直接使用，不再向服务器获取
+                self._register_server_tools(server_name, server_config, declared)
+                status.update(status='declared', tool_count=len(declared))
+                self.logger.info(f"📋 按声明注册 MCP 工具: {server_name} - {len(declared)} 个")
+            elif entry is not None:
+                self._register_server_tools(server_name, server_config, entry['tools'])
+                status.update(status='stale', tool_count=len(entry['tools']), fetched_at=entry['fetched_at'])
+                self.logger.info(f"📦 从缓存注册 MCP 工具: {server_name} - {len(entry['tools'])} 个")
+                if not (self.lazy_start and server_config.get('transport', 'stdio') == 'stdio'):
+                    refresh[server_name] = server_config
+            else:
+                status['status'] = 'pending'
+                refresh[server_name] = server_config
+            self.server_status[server_name] = status
+
+        self.refresh_future = None
+        if refresh:
+            # 所有配置文件中的服务器在 MCP 事件循环中并行获取
+            self.refresh_future = mcp_runner.spawn(self._refresh_all(refresh))
+
+    def _read_server_configs(self) -> Dict[str, Dict[str, Any]]:
+        """读取所有配置文件中启用的服务器配置"""
+        servers = {}
         # 扫描MCP服务器配置文件
-        for filename in os.listdir(self.mcp_dir):
+        for filename in sorted(os.listdir(self.mcp_dir)):
             if filename.endswith(".json"):
                 try:
                     config_path = os.path.join(self.mcp_dir, filename)
@@ -37,144 +96,158 @@ class MCPLoader:
                         config = json.load(f)
 
                     # 解析MCP服务器配置
-                    mcp_servers = config.get("mcpServers", {})
-                    asyncio.run(self._load_all_servers(mcp_servers))
+                    for server_name, server_config in config.get("mcpServers", {}).items():
+                        # 检查是否启用该服务器
+                        if not server_config.get('enabled', True):
+                            self.logger.info(f"⏭️ 跳过禁用的 MCP 服务器: {server_name}")
+                            continue
+                        servers[server_name] = server_config
 
                 except Exception as e:
                     self.logger.error(f"❌ 加载 MCP 配置失败 {filename}: {str(e)}")
+        return servers
 
-    async def _load_all_servers(self, mcp_servers):
-        """异步加载所有MCP服务器"""
-        tasks = []
-        for server_name, server_config in mcp_servers.items():
-            # 检查是否启用该服务器
-            if not server_config.get('enabled', True):
-                self.logger.info(f"⏭️ 跳过禁用的 MCP 服务器: {server_name}")
-                continue
-            
-            self.logger.info(f"📡 连接 MCP 服务器: {server_name}")
-
-            # 获取传输方式和URL
-            transport = server_config.get('transport', 'stdio')
-            url = server_config.get('url')
-
-            # 根据传输方式创建服务器参数
-            if transport == 'stdio':
-                server_params = StdioServerParameters(
-                    command=server_config.get("command"),
-                    args=server_config.get("args", []),
-                    env=server_config.get("env", {}),
-                )
-            else:
-                server_params = None
-
-            tasks.append(self._get_mcp_server_tools(server_name, transport, url, server_params))
-
-        # 并行获取所有服务器的工具列表
-        results = await asyncio.gather(*tasks)
-
-        # 处理所有结果并注册工具
-        for result in results:
-            if result:
-                server_name, server_info, tools = result
-                for tool in tools:
-                    tool_name = f"mcp_{server_name}_{tool.name}"
-                    transport = server_info.get('transport', 'stdio')
-                    url = server_info.get('url')
-                    server_params = server_info.get('server_params')
-                    tool_instance = MCPToolWrapper(
-                        server_params=server_params,
-                        tool_name=tool.name,
-                        description=tool.description,
-                        input_schema=tool.inputSchema,
-                        transport=transport,
-                        url=url
-                    )
-
-                    self.tool_manager.tools[tool_name] = tool_instance
-                    self.tool_manager.tool_descriptions[tool_name] = (
-                        tool.description
-                    )
-                    self.logger.info(f"✅ 注册 MCP 工具: {tool_name}")
-
-    async def _get_mcp_server_tools(self, server_name, transport, url, server_params):
-        """异步获取MCP服务器提供的工具列表"""
-        if transport == 'stdio':
-            from mcp import ClientSession
-            from mcp.client.stdio import stdio_client
-            from contextlib import AsyncExitStack
+    def _config_hash(self, server_config: Dict[str, Any]) -> str:
+        """服务器启动参数的哈希，作为工具列表缓存的键"""
+        key = {
+            'transport': server_config.get('transport', 'stdio'),
+            'command': server_config.get('command'),
+            'args': server_config.get('args', []),
+            'env': server_config.get('env', {}),
+            'url': server_config.get('url'),
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
 
-            async with AsyncExitStack() as stack:
-                try:
-                    # 连接服务器
-                    stdio_transport = await stack.enter_async_context(
-                        stdio_client(server_params)
-                    )
-                    _stdio, write = stdio_transport
+    def _server_params(self, server_config: Dict[str, Any]):
+        """根据传输方式创建服务器参数"""
+        if server_config.get('transport', 'stdio') != 'stdio':
+            return None
+        return StdioServerParameters(
+            command=server_config.get("command"),
+            args=server_config.get("args", []),
+            env=server_config.get("env", {}),
+        )
 
-                    # 创建会话
-                    session = await stack.enter_async_context(ClientSession(_stdio, write))
-                    await session.initialize()
+    def _register_server_tools(self, server_name: str, server_config: Dict[str, Any],
+                               tools: List[Dict[str, Any]]) -> None:
+        """注册服务器的工具，移除服务器已不再提供的工具"""
+        transport = server_config.get('transport', 'stdio')
+        url = server_config.get('url')
+        server_params = self._server_params(server_config)
 
-                    # 获取工具列表
-                    list_tools_response = await session.list_tools()
-                    return (server_name, {'transport': transport, 'server_params': server_params}, list_tools_response.tools)
+        registered = set()
+        for tool in tools:
+            tool_name = f"mcp_{server_name}_{tool['name']}"
+            tool_instance = MCPToolWrapper(
+                server_params=server_params,
+                tool_name=tool['name'],
+                description=tool.get('description'),
+                input_schema=tool.get('inputSchema', {}),
+                transport=transport,
+                url=url,
+                server_name=server_name,
+                idle_timeout=server_config.get('idle_timeout')
+            )
 
-                except Exception as e:
-                    self.logger.error(f"❌ 获取 MCP 工具列表失败: {str(e)}")
-                    return None
+            self.tool_manager.register_tool(
+                tool_name, tool_instance, tool.get('description')
+            )
+            registered.add(tool_name)
+            self.logger.info(f"✅ 注册 MCP 工具: {tool_name}")
+
+        for tool_name in self.server_tools.get(server_name, set()) - registered:
+            self.tool_manager.unregister_tool(tool_name)
+            self.logger.info(f"🗑️ 移除 MCP 工具: {tool_name}")
+        self.server_tools[server_name] = registered
+
+    async def _refresh_all(self, servers: Dict[str, Dict[str, Any]]) -> None:
+        """并行获取服务器的工具列表，更新注册的工具和缓存文件"""
+        await asyncio.gather(*(
+            self._refresh_server(server_name, server_config)
+            for server_name, server_config in servers.items()
+        ))
+        self._save_cache()
+
+    async def _on_server_started(self, server_name: str) -> None:
+        """延迟启动的服务器启动后，刷新其缓存的工具列表"""
+        status = self.server_status.get(server_name)
+        if status is None or status['status'] != 'stale' or server_name in self._refreshing:
+            return
+        await self._refresh_server(server_name, self.servers[server_name])
+        self._save_cache()
+
+    async def _refresh_server(self, server_name: str, server_config: Dict[str, Any]) -> None:
+        """获取单个服务器的工具列表并注册，成功时更新缓存"""
+        status = self.server_status[server_name]
+        self._refreshing.add(server_name)
+        self.logger.info(f"📡 连接 MCP 服务器: {server_name}")
+        try:
+            tools = await self._get_mcp_server_tools(server_name, server_config)
+        except Exception as e:
+            # 有缓存时继续使用缓存的工具，标记为过期
+            status['status'] = 'stale' if status['fetched_at'] else 'failed'
+            status['error'] = str(e)
+            self.logger.error(f"❌ 获取 MCP 工具列表失败 {server_name}: {str(e)}")
+            return
+        finally:
+            self._refreshing.discard(server_name)
+
+        self._register_server_tools(server_name, server_config, tools)
+        status.update(status='fresh', tool_count=len(tools), fetched_at=time.time(), error=None)
+        self.cache_entries[status['config_hash']] = {
+            'server': server_name,
+            'fetched_at': status['fetched_at'],
+            'tools': tools
+        }
+
+    async def _get_mcp_server_tools(self, server_name: str, server_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """异步获取MCP服务器提供的工具列表"""
+        transport = server_config.get('transport', 'stdio')
+        if transport == 'stdio':
+            # 通过会话池获取，会话保持打开供之后的工具调用复用
+            response = await session_pool.list_tools(
+                server_name, self._server_params(server_config), server_config.get('idle_timeout')
+            )
+            return [
+                {'name': tool.name, 'description': tool.description, 'inputSchema': tool.inputSchema}
+                for tool in response.tools
+            ]
         elif transport == 'streamable-http':
-            import requests
-            import json
-            from requests.exceptions import RequestException
-
-            try:
-                payload = {
-                    "jsonrpc": "2.0",
-                    "id": 1,
-                    "method": "listTools",
-                    "params": {}
-                }
-                self.logger.info(f"📡 连接 HTTP MCP 服务器: {url}")
-                resp = requests.post(
-                    url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                    stream=True,
-                    timeout=30
-                )
-                resp.raise_for_status()
-
-                tools = []
-                for line in resp.iter_lines(decode_unicode=True):
-                    if not line:
-                        continue
-                    try:
-                        msg = json.loads(line)
-                        if 'error' in msg:
-                            self.logger.error(f"❌ 服务器返回错误: {msg['error']}")
-                            return None
-                        if 'result' in msg and 'tools' in msg['result']:
-                            tools = msg['result']['tools']
-                            break
-                    except json.JSONDecodeError:
-                        self.logger.warning(f"无法解析响应行: {line}")
-                        continue
-
-                if not tools:
-                    self.logger.warning(f"⚠️ 未从服务器获取到工具列表: {url}")
-                    return None
-
-                return (server_name, {'transport': transport, 'url': url}, tools)
-            except RequestException as e:
-                self.logger.error(f"❌ HTTP 请求失败: {str(e)}")
-                return None
-            except Exception as e:
-                self.logger.error(f"❌ 获取 HTTP MCP 工具列表失败: {str(e)}")
-                return None
+            # 通过 HTTP 客户端获取，连接和会话供之后的工具调用复用
+            client = session_pool.http_client(server_name, server_config.get('url'))
+            return await client.list_tools()
         else:
-            self.logger.error(f"❌ 不支持的传输方式: {transport}")
-            return None
+            raise ValueError(f"不支持的传输方式: {transport}")
+
+    def _load_cache(self) -> Dict[str, Any]:
+        """读取工具列表缓存，文件不存在或损坏时返回空缓存"""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f).get('servers', {})
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            self.logger.warning(f"⚠️ 读取 MCP 工具列表缓存失败，忽略缓存: {str(e)}")
+            return {}
+
+    def _save_cache(self) -> None:
+        """写入工具列表缓存，只保留当前配置对应的条目"""
+        hashes = {self._config_hash(server_config) for server_config in self.servers.values()}
+        entries = {key: entry for key, entry in self.cache_entries.items() if key in hashes}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'servers': entries}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.cache_path)
+            self.logger.info(f"💾 保存 MCP 工具列表缓存: {len(entries)} 个服务器")
+        except Exception as e:
+            self.logger.error(f"❌ 保存 MCP 工具列表缓存失败: {str(e)}")
+
+    def get_server_status(self) -> Dict[str, Dict[str, Any]]:
+        """获取各服务器工具列表状态：fresh (已从服务器获取) / stale (使用缓存) / declared (配置中声明) /
+        pending (获取中) / failed (获取失败且无缓存)"""
+        return {name: dict(status) for name, status in list(self.server_status.items())}
 
     def add_mcp_tool(self, config: Dict[str, Any]) -> bool:
         """添加MCP工具"""
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MCP 会话池模块
+
+每个 stdio MCP 服务器保持一个长连接会话：首次调用时启动子进程并完成初始化，
+之后的调用复用同一个 ClientSession（JSON-RPC 请求可以并发复用一个连接），
+空闲超过 MCP_IDLE_TIMEOUT 秒（可在服务器配置中用 idle_timeout 单独设置）后关闭子进程，
+下次调用时重新启动。
+streamable-http 服务器每个保持一个 MCPHttpClient，复用连接池和服务器分配的会话ID。
+所有会话都运行在 mcp_runner 的事件循环中，调用方通过 mcp_runner 提交协程。
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from contextlib import AsyncExitStack
+import asyncio
+import atexit
+import concurrent.futures
+import time
+from mcp import ClientSession
+from mcp.client.stdio import stdio_client
+try:
+    from mcp.shared.exceptions import McpError
+except ImportError:
+    # mcp 2.x 中更名为 MCPError
+    from mcp.shared.exceptions import MCPError as McpError
+from config.settings import Config
+from utils.async_runner import mcp_runner
+from utils.logger import get_logger
+from .mcp_http import MCPHttpClient
+
+# 退出时等待会话关闭的最长时间（秒）
+CLOSE_TIMEOUT = 5
+
+
+class MCPServerSession:
+    """一个 stdio MCP 服务器的长连接会话"""
+
+    def __init__(self, server_name: str, server_params, max_concurrency: int, idle_timeout: float,
+                 on_start: Optional[Callable[[str], None]] = None):
+        self.logger = get_logger(__name__)
+        self.server_name = server_name
+        self.server_params = server_params
+        self.max_concurrency = max(1, max_concurrency)
+        self.idle_timeout = idle_timeout
+        self.on_start = on_start
+
+        # 当前会话的初始化结果、停止信号和持有会话的任务，会话关闭后重置为 None
+        self._ready: Optional[asyncio.Future] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._owner: Optional[asyncio.Task] = None
+        # 限制同时发往该服务器的调用数，超出的调用排队等待
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self.last_used = time.monotonic()
+        self.starts = 0
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._ready is not None and self._ready.done() and self._ready.exception() is None
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]):
+        """在长连接会话中调用工具，会话未启动时先启动"""
+        return await self._request(lambda session: session.call_tool(name=tool_name, arguments=arguments))
+
+    async def list_tools(self):
+        """获取服务器的工具列表"""
+        return await self._request(lambda session: session.list_tools())
+
+    async def _request(self, send):
+        """在会话中发送一个请求，send 接收会话并返回请求协程"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            # 先计数再等待，空闲检查不会关闭即将使用的会话
+            self._in_flight += 1
+            self.last_used = time.monotonic()
+            try:
+                session = await self._session()
+                try:
+                    return await send(session)
+                except McpError:
+                    # 服务器返回的 JSON-RPC 错误，连接本身正常
+                    self.failures += 1
+                    raise
+                except Exception as e:
+                    # 子进程可能已退出或连接已断开，关闭会话，下次调用重新启动
+                    self.failures += 1
+                    self._discard()
+                    raise ConnectionError(f"MCP 服务器连接已断开 {self.server_name}: {str(e) or type(e).__name__}") from e
+            finally:
+                self._in_flight -= 1
+                self.calls += 1
+                self.last_used = time.monotonic()
+
+    async def _session(self) -> ClientSession:
+        """获取已初始化的会话，没有可用会话时启动子进程"""
+        if self._ready is None:
+            self._ready = asyncio.get_running_loop().create_future()
+            self._stop = asyncio.Event()
+            self._owner = asyncio.ensure_future(self._own(self._ready, self._stop))
+            self.starts += 1
+        # 多个调用等待同一次启动，单个调用被取消不影响启动过程
+        return await asyncio.shield(self._ready)
+
+    async def _own(self, ready: asyncio.Future, stop: asyncio.Event):
+        """启动子进程并持有会话直到空闲超时或收到停止信号
+
+        stdio_client 和 ClientSession 的上下文必须在同一个任务中进入和退出，
+        因此由这个任务持有会话，调用方只借用会话对象。
+        """
+        started = time.monotonic()
+        try:
+            async with AsyncExitStack() as stack:
+                read, write = await stack.enter_async_context(stdio_client(self.server_params))
+                session = await stack.enter_async_context(ClientSession(read, write))
+                await session.initialize()
+
+                self.logger.info(f"🔌 MCP 服务器已启动: {self.server_name}, 耗时: {time.monotonic() - started:.2f}s")
+                ready.set_result(session)
+                if self.on_start is not None:
+                    self.on_start(self.server_name)
+                await self._wait_idle(ready, stop)
+        except Exception as e:
+            if not ready.done():
+                self.logger.error(f"❌ MCP 服务器启动失败 {self.server_name}: {str(e)}")
+                # 启动失败的结果只交给正在等待的调用，下次调用重新启动
+                ready.set_exception(e)
+            else:
+                self.logger.error(f"❌ MCP 会话异常关闭 {self.server_name}: {str(e)}")
+        finally:
+            if self._ready is ready:
+                self._ready = None
+            self.logger.info(f"🔌 MCP 服务器已关闭: {self.server_name}")
+
+    async def _wait_idle(self, ready: asyncio.Future, stop: asyncio.Event):
+        """等待停止信号或空闲超时"""
+        while not stop.is_set():
+            timeout = None
+            if self.idle_timeout > 0:
+                # 有调用进行中时等待一个完整的空闲周期，避免超时为 0 时空转
+                timeout = self.idle_timeout
+                if self._in_flight == 0:
+                    timeout = max(0.0, self.last_used + self.idle_timeout - time.monotonic())
+            try:
+                await asyncio.wait_for(stop.wait(), timeout)
+            except asyncio.TimeoutError:
+                if self._in_flight == 0 and time.monotonic() - self.last_used >= self.idle_timeout:
+                    self.logger.info(f"💤 MCP 服务器空闲超时: {self.server_name}")
+                    # 与检查在同一步中解除引用，之后的调用会启动新的会话
+                    if self._ready is ready:
+                        self._ready = None
+                    return
+
+    def _discard(self):
+        """停止当前会话"""
+        if self._stop is not None:
+            self._stop.set()
+        self._ready = None
+
+    async def aclose(self):
+        """关闭会话并等待子进程退出"""
+        owner = self._owner
+        self._discard()
+        if owner is not None and not owner.done():
+            await owner
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'in_flight': self._in_flight,
+            'starts': self.starts,
+            'calls': self.calls,
+            'failures': self.failures,
+            'idle_seconds': round(time.monotonic() - self.last_used, 1)
+        }
+
+
+class MCPSessionPool:
+    """按服务器管理 MCP 长连接会话和 HTTP 客户端，方法需在 mcp_runner 的事件循环中调用"""
+
+    def __init__(self, idle_timeout: float, max_concurrency: int):
+        self.logger = get_logger(__name__)
+        self.idle_timeout = idle_timeout
+        self.max_concurrency = max_concurrency
+        self._servers: Dict[str, MCPServerSession] = {}
+        self._http_clients: Dict[str, MCPHttpClient] = {}
+        self._start_callbacks: List[Callable[[str], Awaitable[None]]] = []
+
+    def on_start(self, callback: Callable[[str], Awaitable[None]]):
+        """注册服务器启动回调，每次启动子进程并初始化完成后以服务器名调用"""
+        self._start_callbacks.append(callback)
+
+    def _notify_start(self, server_name: str):
+        for callback in self._start_callbacks:
+            asyncio.ensure_future(callback(server_name))
+
+    def get(self, server_name: str, server_params, idle_timeout: Optional[float] = None) -> MCPServerSession:
+        """获取服务器会话，服务器配置变化时替换旧会话；idle_timeout 为空时使用全局配置"""
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+        server = self._servers.get(server_name)
+        if server is None or server.server_params != server_params:
+            if server is not None:
+                asyncio.ensure_future(server.aclose())
+            server = MCPServerSession(
+                server_name, server_params, self.max_concurrency, idle_timeout, self._notify_start
+            )
+            self._servers[server_name] = server
+        server.idle_timeout = idle_timeout
+        return server
+
+    async def call_tool(self, server_name: str, server_params, tool_name: str, arguments: Dict[str, Any],
+                        idle_timeout: Optional[float] = None):
+        """调用指定服务器的工具"""
+        return await self.get(server_name, server_params, idle_timeout).call_tool(tool_name, arguments)
+
+    async def list_tools(self, server_name: str, server_params, idle_timeout: Optional[float] = None):
+        """获取指定服务器的工具列表，会话保持打开供之后的调用复用"""
+        return await self.get(server_name, server_params, idle_timeout).list_tools()
+
+    def http_client(self, server_name: str, url: str) -> MCPHttpClient:
+        """获取 streamable-http 服务器的客户端，服务器地址变化时替换旧客户端"""
+        client = self._http_clients.get(server_name)
+        if client is None or client.url != url:
+            if client is not None:
+                asyncio.ensure_future(client.aclose())
+            client = MCPHttpClient(server_name, url, self.max_concurrency)
+            self._http_clients[server_name] = client
+        return client
+
+    async def aclose(self):
+        """关闭全部会话和 HTTP 客户端"""
+        servers = list(self._servers.values())
+        clients = list(self._http_clients.values())
+        self._servers.clear()
+        self._http_clients.clear()
+        await asyncio.gather(
+            *(server.aclose() for server in servers),
+            *(client.aclose() for client in clients),
+            return_exceptions=True
+        )
+
+    def close(self):
+        """在退出时关闭全部会话，终止子进程"""
+        if not mcp_runner.started or not (self._servers or self._http_clients):
+            return
+        names = ', '.join([*self._servers, *self._http_clients])
+        try:
+            mcp_runner.run(self.aclose(), timeout=CLOSE_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            # 仍在启动的服务器不响应关闭，子进程随主进程退出
+            self.logger.warning(f"⚠️ MCP 会话未在 {CLOSE_TIMEOUT} 秒内关闭: {names}")
+        except Exception as e:
+            self.logger.error(f"❌ 关闭 MCP 会话失败: {e!r}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各服务器会话统计"""
+        stats = {name: server.get_stats() for name, server in list(self._servers.items())}
+        stats.update({name: client.get_stats() for name, client in list(self._http_clients.items())})
+        return stats
+
+
+# 全局会话池
+session_pool = MCPSessionPool(Config.MCP_IDLE_TIMEOUT, Config.MCP_MAX_CONCURRENCY)
+atexit.register(session_pool.close)
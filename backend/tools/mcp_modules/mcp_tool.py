@@ -4,17 +4,18 @@
 MCP工具包装器模块
 """
 
-from mcp import ClientSession
-from mcp.client.stdio import stdio_client
-from contextlib import AsyncExitStack
-import asyncio
+from utils.async_runner import mcp_runner
 from utils.logger import get_logger
+from .mcp_pool import session_pool
 
 
 class MCPToolWrapper:
     """MCP 工具包装器"""
 
-    def __init__(self, server_params, tool_name, description, input_schema, transport='stdio', url=None):
+    def __init__(self, server_params, tool_name, description, input_schema, transport='stdio', url=None,
+                 server_name=None, idle_timeout=None):
+        self.server_name = server_name or tool_name
+        self.idle_timeout = idle_timeout
         self.server_params = server_params
         self.tool_name = tool_name
         self.description = description
@@ -34,9 +35,16 @@ class MCPToolWrapper:
     def execute(self, parameters):
         """执行 MCP 工具"""
         try:
-            # 异步执行工具调用
-            result = asyncio.run(self._async_execute(parameters))
-            return result
+            # 会话和 HTTP 连接池都运行在 MCP 事件循环中
+            return mcp_runner.run(self._async_execute(parameters))
+        except Exception as e:
+            self.logger.error(f"❌ MCP 工具执行失败: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    async def aexecute(self, parameters):
+        """异步执行 MCP 工具，调用交给 MCP 事件循环，调用方的事件循环不被阻塞"""
+        try:
+            return await mcp_runner.submit(self._async_execute(parameters))
         except Exception as e:
             self.logger.error(f"❌ MCP 工具执行失败: {str(e)}")
             return {"success": False, "error": str(e)}
@@ -44,80 +52,32 @@ class MCPToolWrapper:
     async def _async_execute(self, parameters):
         """异步执行 MCP 工具"""
         if self.transport == 'stdio':
-            async with AsyncExitStack() as stack:
-                stdio_transport = await stack.enter_async_context(
-                    stdio_client(self.server_params)
-                )
-                _stdio, write = stdio_transport
-
-                session = await stack.enter_async_context(ClientSession(_stdio, write))
-                await session.initialize()
-
-                # 调用工具
-                response = await session.call_tool(
-                    name=self.tool_name, arguments=parameters
-                )
-
-                # 处理响应
-                if response.isError:
-                    error_msg = response.content[0].text if response.content else "未知错误"
-                    return {"success": False, "error": error_msg}
-
-                # 提取文本内容
-                result = []
-                for content_block in response.content:
-                    if hasattr(content_block, "text"):
-                        result.append(content_block.text)
-                    else:
-                        result.append(f"[非文本内容: {type(content_block).__name__}]")
-
-                return {"success": True, "result": "\n".join(result)}
+            # 复用服务器的长连接会话调用工具
+            response = await session_pool.call_tool(
+                self.server_name, self.server_params, self.tool_name, parameters, self.idle_timeout
+            )
+            is_error = response.isError
+            content = [
+                block.text if hasattr(block, "text") else f"[非文本内容: {type(block).__name__}]"
+                for block in response.content
+            ]
         elif self.transport == 'streamable-http':
-            import requests
-            import json
-            from requests.exceptions import RequestException
-
-            payload = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "callTool",
-                "params": {
-                    "name": self.tool_name,
-                    "arguments": parameters
-                }
-            }
-
-            try:
-                resp = requests.post(
-                    self.url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                    stream=True,
-                    timeout=30
-                )
-                resp.raise_for_status()
-
-                result = []
-                for line in resp.iter_lines(decode_unicode=True):
-                    if not line:
-                        continue
-                    try:
-                        msg = json.loads(line)
-                        if 'error' in msg:
-                            return {"success": False, "error": msg['error'].get('message', '未知错误')}
-                        if 'result' in msg:
-                            result.append(str(msg['result']))
-                    except json.JSONDecodeError:
-                        self.logger.warning(f"无法解析响应行: {line}")
-                        continue
-
-                if not result:
-                    return {"success": False, "error": "未收到有效的响应数据"}
-                
-                return {"success": True, "result": "\n".join(result)}
-            except RequestException as e:
-                return {"success": False, "error": f"HTTP请求失败: {str(e)}"}
-            except Exception as e:
-                return {"success": False, "error": f"处理响应失败: {str(e)}"}
+            # 复用服务器的 HTTP 连接池和会话
+            response = await session_pool.http_client(self.server_name, self.url).call_tool(
+                self.tool_name, parameters
+            )
+            is_error = response.get("isError", False)
+            content = [
+                block.get("text", "") if block.get("type") == "text" else f"[非文本内容: {block.get('type')}]"
+                for block in response.get("content", [])
+            ]
         else:
             return {"success": False, "error": f"不支持的传输方式: {self.transport}"}
+
+        # 处理响应
+        if is_error:
+            error_msg = content[0] if content else "未知错误"
+            return {"success": False, "error": error_msg}
+
+        # 提取文本内容
+        return {"success": True, "result": "\n".join(content)}
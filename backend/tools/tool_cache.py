@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 工具结果缓存模块
+
+声明为可缓存的工具，相同参数的调用在有效期内直接返回上次的结果。
+缓存键为工具名加规范化后的参数（键排序的 JSON），条目按最近使用顺序淘汰，
+总条数和估算字节数都有上限。工具可以提供结果所依赖的外部状态版本（如文件的修改时间），
+命中时版本不一致视为失效。
+"""
+
+from typing import Any, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+import json
+import threading
+import time
+
+# 标记未命中，结果本身可能是 None
+MISS = object()
+
+
+def make_key(tool_name: str, parameters: Dict[str, Any]) -> Tuple[str, str]:
+    """生成缓存键，参数顺序和空白不同的等价调用得到相同的键"""
+    canonical = json.dumps(parameters, sort_keys=True, ensure_ascii=False,
+                           separators=(',', ':'), default=str)
+    return tool_name, canonical
+
+
+class ToolResultCache:
+    """带有效期的 LRU 工具结果缓存"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # 键 -> (过期时间, 版本, 结果, 估算字节数)
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[float, Hashable, Any, int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: Tuple[str, str], version: Hashable = None) -> Any:
+        """查找缓存结果，未命中、过期或版本不一致时返回 MISS"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+
+            expires_at, cached_version, result, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expired += 1
+                self.misses += 1
+                return MISS
+            if cached_version != version:
+                self._remove(key)
+                self.stale += 1
+                self.misses += 1
+                return MISS
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Tuple[str, str], result: Any, ttl: float, version: Hashable = None):
+        """写入结果，超过上限时淘汰最久未使用的条目"""
+        if not self.enabled or ttl <= 0:
+            return
+        size = len(key[1]) + len(json.dumps(result, ensure_ascii=False, default=str))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, version, result, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tool_name: Optional[str] = None) -> int:
+        """清除指定工具的缓存，不指定时清除全部，返回清除的条目数"""
+        with self._lock:
+            if tool_name is None:
+                keys = list(self._entries)
+            else:
+                keys = [key for key in self._entries if key[0] == tool_name]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def _remove(self, key: Tuple[str, str]):
+        """删除条目，调用方需持有锁"""
+        entry = self._entries.pop(key)
+        self._bytes -= entry[3]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'expired': self.expired,
+                'stale': self.stale,
+                'evictions': self.evictions
+            }
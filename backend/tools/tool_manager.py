@@ -7,8 +7,13 @@ APOS 工具管理器
 import json
 import importlib
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
+from config.settings import Config
+from utils.async_runner import runner
 from utils.logger import get_logger
+from core.blob_store import BlobStore
+from .tool_cache import MISS, ToolResultCache, make_key
 from mcp import StdioServerParameters
 import asyncio
 
@@ -20,6 +25,20 @@ class ToolManager:
         self.logger = get_logger(__name__)
         self.tools: Dict[str, Any] = {}
         self.tool_descriptions: Dict[str, str] = {}
+        # 工具注册表版本，每次注册工具时递增，依赖工具列表的缓存据此失效
+        self.version = 0
+        self._description_cache = None
+        # 同一轮的多个工具调用在共享线程池中并行执行
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, Config.TOOL_MAX_WORKERS), thread_name_prefix="tool"
+        )
+        # 可缓存工具的结果缓存
+        self.result_cache = ToolResultCache(
+            max_entries=Config.TOOL_CACHE_MAX_ENTRIES,
+            max_bytes=Config.TOOL_CACHE_MAX_BYTES,
+        )
+        # 超出预算的完整工具结果按内容哈希存放，与图片共用存储目录
+        self.result_store = BlobStore()
 
         # 加载内置工具
         self._load_builtin_tools()
@@ -37,6 +56,7 @@ class ToolManager:
             "calculator",
             "weather",
             "time_utils",
+            "result_reader",
         ]
 
         for tool_name in builtin_tools:
@@ -47,8 +67,7 @@ class ToolManager:
                 )
                 tool_instance = tool_class()
 
-                self.tools[tool_name] = tool_instance
-                self.tool_descriptions[tool_name] = tool_instance.get_description()
+                self.register_tool(tool_name, tool_instance, tool_instance.get_description())
 
                 self.logger.info(f"✅ 加载内置工具: {tool_name}")
 
@@ -62,6 +81,26 @@ class ToolManager:
         self.mcp_loader = MCPLoader(self)
         self.mcp_loader.load_mcp_tools()
 
+    def register_tool(self, tool_name: str, tool: Any, description: str):
+        """注册或替换工具"""
+        self.tools[tool_name] = tool
+        self.tool_descriptions[tool_name] = description
+        self.version += 1
+        self.result_cache.invalidate(tool_name)
+
+    def unregister_tool(self, tool_name: str):
+        """移除工具"""
+        if self.tools.pop(tool_name, None) is not None:
+            self.tool_descriptions.pop(tool_name, None)
+            self.version += 1
+            self.result_cache.invalidate(tool_name)
+
+    def invalidate_cache(self, tool_name: Optional[str] = None) -> int:
+        """清除指定工具的结果缓存，不指定时清除全部，返回清除的条目数"""
+        count = self.result_cache.invalidate(tool_name)
+        self.logger.info(f"🧹 清除工具结果缓存: {tool_name or '全部'} - {count} 条")
+        return count
+
     async def _get_mcp_server_tools(self, server_params):
         """此方法已迁移至 MCPLoader"""
         pass
@@ -80,15 +119,32 @@ class ToolManager:
                 "success": False,
                 "error": error_msg,
                 "available_tools": list(self.tools.keys()),
+                "tool": tool_name,
             }
 
         try:
             tool = self.tools[tool_name]
+
+            # 可缓存的工具先查缓存，版本为 None 表示本次调用不缓存
+            version = None
+            if getattr(tool, "cacheable", False) and self.result_cache.enabled:
+                version = tool.get_cache_version(parameters)
+            if version is not None:
+                key = make_key(tool_name, parameters)
+                result = self.result_cache.get(key, version)
+                if result is not MISS:
+                    self.logger.info(f"♻️ 工具结果命中缓存: {tool_name}")
+                    return {"success": True, "result": result, "tool": tool_name}
+
             result = tool.execute(parameters)
 
             self.logger.info(f"✅ 工具执行成功: {tool_name}")
             self.logger.debug(f"📤 工具结果: {result}")
 
+            # 内置工具出错时返回带 error 字段的结果，不缓存
+            if version is not None and not (isinstance(result, dict) and "error" in result):
+                self.result_cache.put(key, result, tool.cache_ttl, version)
+
             return {"success": True, "result": result, "tool": tool_name}
 
         except Exception as e:
@@ -96,11 +152,112 @@ class ToolManager:
             self.logger.error(f"❌ {error_msg}")
             return {"success": False, "error": error_msg, "tool": tool_name}
 
+    async def aexecute_tool(
+        self, tool_name: str, parameters: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """异步执行工具并按预算截断结果；提供 aexecute 的工具直接在事件循环中执行，其余工具在线程池中执行"""
+        tool = self.tools.get(tool_name)
+        loop = asyncio.get_running_loop()
+        if not hasattr(tool, "aexecute"):
+            return await loop.run_in_executor(
+                self.executor,
+                lambda: self.limit_result(self.execute_tool(tool_name, parameters)),
+            )
+
+        self.logger.info(f"🚀 异步执行工具: {tool_name}")
+        self.logger.debug(f"📋 工具参数: {parameters}")
+
+        try:
+            result = await tool.aexecute(parameters)
+
+            self.logger.info(f"✅ 工具执行成功: {tool_name}")
+            self.logger.debug(f"📤 工具结果: {result}")
+
+            # 超长结果需要写入存储，放到线程池中避免阻塞事件循环
+            return await loop.run_in_executor(
+                self.executor,
+                self.limit_result,
+                {"success": True, "result": result, "tool": tool_name},
+            )
+
+        except Exception as e:
+            error_msg = f"工具执行失败: {str(e)}"
+            self.logger.error(f"❌ {error_msg}")
+            return {"success": False, "error": error_msg, "tool": tool_name}
+
+    def limit_result(self, tool_result: Dict[str, Any]) -> Dict[str, Any]:
+        """结果超出工具的字符预算时，完整结果存入结果存储，只返回开头部分和引用"""
+        if not tool_result.get("success"):
+            return tool_result
+
+        tool_name = tool_result["tool"]
+        limit = getattr(self.tools.get(tool_name), "result_max_chars", None)
+        if limit is None:
+            limit = Config.TOOL_RESULT_MAX_CHARS
+        if limit <= 0:
+            return tool_result
+
+        result = tool_result["result"]
+        text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+        if len(text) <= limit:
+            return tool_result
+
+        ref = self.result_store.put(text.encode("utf-8"))
+        self.logger.info(f"✂️ 工具结果过长已截断: {tool_name} - {len(text)} 字符, 引用: {ref}")
+        return {
+            "success": True,
+            "result": {
+                "truncated": True,
+                "ref": ref,
+                "total_chars": len(text),
+                "preview": text[:limit],
+                "next_offset": limit,
+                "note": f"结果过长，仅显示前 {limit} 个字符，可调用 result_reader 工具传入 ref 和 offset 分页读取剩余内容",
+            },
+            "tool": tool_name,
+        }
+
+    async def aexecute_tools(
+        self, tool_calls: List[Dict[str, Any]], timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """并行执行多个工具调用，按调用顺序返回结果；单个调用失败或超时不影响其他调用"""
+        if timeout is None:
+            timeout = Config.TOOL_TIMEOUT
+        if len(tool_calls) > 1:
+            self.logger.info(f"🚀 并行执行 {len(tool_calls)} 个工具调用")
+
+        tasks = [
+            asyncio.ensure_future(self.aexecute_tool(call["tool"], call.get("parameters", {})))
+            for call in tool_calls
+        ]
+        # 整批共用一个截止时间，最慢的调用决定本轮耗时
+        done, _ = await asyncio.wait(tasks, timeout=timeout if timeout > 0 else None)
+
+        results = []
+        for call, task in zip(tool_calls, tasks):
+            if task in done:
+                results.append(task.result())
+                continue
+
+            # 线程池中的同步工具无法强制终止，会在后台继续运行，结果被丢弃
+            task.cancel()
+            error_msg = f"工具执行超时（{timeout:g} 秒）"
+            self.logger.error(f"❌ {call['tool']}: {error_msg}")
+            results.append({"success": False, "error": error_msg, "tool": call["tool"]})
+        return results
+
+    def execute_tools(
+        self, tool_calls: List[Dict[str, Any]], timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """aexecute_tools 的同步版本"""
+        return runner.run(self.aexecute_tools(tool_calls, timeout))
+
     def get_available_tools(self) -> List[Dict[str, Any]]:
         """获取可用工具列表"""
         tools_list = []
 
-        for tool_name, tool in self.tools.items():
+        # MCP 工具在后台线程中注册，遍历快照
+        for tool_name, tool in list(self.tools.items()):
             tools_list.append(
                 {
                     "name": tool_name,
@@ -114,7 +271,12 @@ class ToolManager:
         return tools_list
 
     def get_tools_description(self) -> str:
-        """获取工具描述文本，包含名称、描述和参数说明"""
+        """获取工具描述文本，包含名称、描述和参数说明；工具注册表不变时返回缓存"""
+        cache = self._description_cache
+        if cache and cache[0] == self.version:
+            return cache[1]
+
+        version = self.version
         descriptions = []
         available_tools = self.get_available_tools()
 
@@ -131,7 +293,9 @@ class ToolManager:
             
             descriptions.append(f"- {tool_name}: {description} (调用参数: {params_description})")
 
-        return "\n".join(descriptions)
+        text = "\n".join(descriptions)
+        self._description_cache = (version, text)
+        return text
 
     def add_mcp_tool(self, config: Dict[str, Any]) -> bool:
         """添加 MCP 工具"""
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 异步运行器
+
+进程内共享一个后台事件循环，所有 Agent 协程都在这个循环中执行：
+- 同步代码（Flask 视图、脚本）通过 run / iterate 阻塞等待结果，或通过 spawn 在后台启动
+- 其他事件循环（ASGI 服务器）通过 submit / relay 等待结果而不阻塞自身
+
+会话锁等异步对象因此始终绑定在同一个事件循环上，同步接口和 ASGI 接口可以同时使用。
+MCP 的全部 I/O（stdio 会话、HTTP 连接池、工具列表获取）运行在单独的 mcp_runner 循环中，
+子进程和网络读写不会与 Agent 协程争用同一个循环。
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional
+
+
+class AsyncRunner:
+    """在后台线程中运行的共享事件循环"""
+
+    def __init__(self, name: str = 'apos-async'):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._guard = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """后台事件循环，首次使用时启动"""
+        with self._guard:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _schedule(self, coro: Awaitable[Any]):
+        loop = self.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError('不能在共享事件循环内同步等待协程，请直接 await')
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    @property
+    def started(self) -> bool:
+        """后台事件循环是否已启动"""
+        return self._loop is not None
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """在共享事件循环中执行协程，阻塞当前线程直到返回，超时抛出 TimeoutError"""
+        return self._schedule(coro).result(timeout)
+
+    def iterate(self, agen: AsyncIterator[Any]) -> Iterator[Any]:
+        """将异步生成器转换为同步迭代器，提前结束迭代会关闭异步生成器"""
+        try:
+            while True:
+                try:
+                    yield self.run(_next(agen))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(_close(agen))
+
+    def spawn(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """在共享事件循环中启动协程，不等待结果，返回可跨线程等待的 Future"""
+        return self._schedule(coro)
+
+    async def submit(self, coro: Awaitable[Any]) -> Any:
+        """从其他事件循环中等待共享事件循环执行协程"""
+        return await asyncio.wrap_future(self._schedule(coro))
+
+    async def relay(self, agen: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """从其他事件循环中迭代共享事件循环上的异步生成器"""
+        try:
+            while True:
+                try:
+                    yield await self.submit(_next(agen))
+                except StopAsyncIteration:
+                    return
+        finally:
+            await self.submit(_close(agen))
+
+
+async def _next(agen: AsyncIterator[Any]) -> Any:
+    return await agen.__anext__()
+
+
+async def _close(agen: AsyncIterator[Any]):
+    await agen.aclose()
+
+
+# 全局运行器
+runner = AsyncRunner()
+# MCP I/O 专用运行器
+mcp_runner = AsyncRunner('apos-mcp')
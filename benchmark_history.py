@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 会话历史追加性能基准
+
+比较 SessionHistory.append 与旧版做法（列表追加后按 trim 记录重建整个列表）
+在达到 MAX_HISTORY_LENGTH 前后的单次追加耗时。
+默认上限 10000 条，追加到上限的两倍，每 10 条消息中有 1 条系统消息。
+
+用法: python benchmark_history.py [上限] [追加总数]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from core.session_history import SessionHistory
+from core.session_store import apply_record
+
+BLOCK = 1000
+
+
+def make_message(seq: int):
+    return {'role': 'system' if seq % 10 == 0 else 'user', 'content': 'x', 'seq': seq}
+
+
+def append_old(messages, message, max_length: int):
+    """旧版：追加到列表，超出长度时按 trim 记录重建列表"""
+    messages.append(message)
+    overflow = len(messages) - max_length
+    if overflow > 0:
+        apply_record(messages, {'op': 'trim', 'count': overflow})
+
+
+def measure(append, total: int):
+    """返回每个区块的平均单次追加耗时（微秒）"""
+    costs = []
+    for start in range(1, total + 1, BLOCK):
+        messages = [make_message(seq) for seq in range(start, min(start + BLOCK, total + 1))]
+        begin = time.perf_counter()
+        for message in messages:
+            append(message)
+        costs.append((time.perf_counter() - begin) / len(messages) * 1e6)
+    return costs
+
+
+def main():
+    max_length = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else max_length * 2
+
+    print(f"📏 上限 {max_length} 条，追加 {total} 条消息")
+    history = SessionHistory(max_length)
+    new_costs = measure(history.append, total)
+    old_list = []
+    old_costs = measure(lambda message: append_old(old_list, message, max_length), total)
+
+    if list(history) != old_list:
+        print("❌ 两种做法保留的消息不一致")
+        return 1
+
+    print(f"\n{'消息数':>8}  {'SessionHistory':>16}  {'列表重建':>12}")
+    for index, (new, old) in enumerate(zip(new_costs, old_costs)):
+        count = min((index + 1) * BLOCK, total)
+        print(f"{count:>8}  {new:>13.2f} us  {old:>9.2f} us")
+
+    # 超过上限后的区块：SessionHistory 应保持平稳，列表重建随长度线性增长
+    over = range((max_length + BLOCK - 1) // BLOCK, len(new_costs))
+    if over:
+        new_over = sum(new_costs[index] for index in over) / len(over)
+        old_over = sum(old_costs[index] for index in over) / len(over)
+        print(f"\n📊 超过上限后平均单次追加: SessionHistory {new_over:.2f} us, 列表重建 {old_over:.2f} us "
+              f"({old_over / new_over:.0f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
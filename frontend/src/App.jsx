@@ -142,7 +142,7 @@ function App() {
         }
     }
 
-    const handleToolConfirmation = async (messageId, toolCall, decision) => {
+    const handleToolConfirmation = async (messageId, toolCall, toolCalls, decision) => {
         setIsLoading(true);
         try {
             const response = await fetch('http://localhost:8880/api/confirm-tool', {
@@ -153,6 +153,7 @@ function App() {
                 body: JSON.stringify({
                     session_id: sessionId,
                     tool_call: toolCall,
+                    tool_calls: toolCalls,
                     decision: decision
                 })
             });
@@ -169,6 +170,7 @@ function App() {
                     timestamp: new Date().toLocaleTimeString(),
                     status: data.status,
                     tool_call: data.tool_call,
+                    tool_calls: data.tool_calls,
                     type: 'tool_confirmation'
                 };
             } else {
@@ -277,6 +279,7 @@ function App() {
                     timestamp: new Date().toLocaleTimeString(),
                     status: data.status,
                     tool_call: data.tool_call || parsed.tool_call,
+                    tool_calls: data.tool_calls,
                     type: 'tool_confirmation'
                 };
             } else {
@@ -490,6 +493,11 @@ function App() {
                                                                 </div>
                                                                 <div className="bg-white/80 dark:bg-slate-900/80 p-3 rounded-lg text-sm mb-3 shadow-sm border border-slate-100 dark:border-slate-700">
                                                                     <div className="font-medium mb-2">工具名称: {message.tool_call.tool}</div>
+                                                                    {message.tool_calls && message.tool_calls.length > 1 && (
+                                                                        <div className="text-xs text-slate-600 dark:text-slate-400 mb-2">
+                                                                            本轮共 {message.tool_calls.length} 个工具调用: {message.tool_calls.map(call => call.tool).join(', ')}
+                                                                        </div>
+                                                                    )}
                                                                     <div className="mb-2">
                                                                         <div className="font-medium mb-1">参数:</div>
                                                                         <ul className="list-disc list-inside space-y-1 text-xs">
@@ -508,7 +516,7 @@ function App() {
                                                                             variant="outline"
                                                                             size="sm"
                                                                             className="px-4 py-2 text-sm font-medium border-slate-300 dark:border-slate-600 hover:bg-slate-100 dark:hover:bg-slate-700 transition-colors"
-                                                                            onClick={() => handleToolConfirmation(message.id, message.tool_call, 'deny')}
+                                                                            onClick={() => handleToolConfirmation(message.id, message.tool_call, message.tool_calls, 'deny')}
                                                                             disabled={isLoading}
                                                                         >
                                                                             拒绝
@@ -516,7 +524,7 @@ function App() {
                                                                         <Button
                                                                             size="sm"
                                                                             className="px-4 py-2 text-sm font-medium bg-primary hover:bg-primary/90 text-primary-foreground transition-colors"
-                                                                            onClick={() => handleToolConfirmation(message.id, message.tool_call, 'allow')}
+                                                                            onClick={() => handleToolConfirmation(message.id, message.tool_call, message.tool_calls, 'allow')}
                                                                             disabled={isLoading}
                                                                         >
                                                                             允许
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APOS 并发压力测试
+
+在本地启动一个模拟 OpenAI 接口的 LLM 服务和一个多线程的 APOS 后端，
+向多个会话并发发送大量 /api/chat 请求，然后检查：
+- 每个会话的历史记录按 用户/助手 交替排列，序号严格递增
+- 每条助手回复对应紧邻的用户消息（模拟 LLM 原样回显最后一条用户消息）
+- LLM 每次收到的历史都以本次请求的用户消息结尾
+- 重新从磁盘加载的历史记录与内存中的一致
+
+无需真实的 API Key，会话数据写入临时目录。
+使用 --asgi 参数时后端改为通过 uvicorn 以 ASGI 方式运行（需要安装 uvicorn）。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+# 并发参数
+SESSION_COUNT = 8
+MESSAGES_PER_SESSION = 12
+WORKERS = 32
+
+# 模拟 LLM 检测到的历史异常
+llm_errors = []
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """模拟 OpenAI Chat Completions 接口，回显最后一条用户消息"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        messages = body['messages'][1:]  # 跳过系统提示词
+
+        # 同一会话的请求串行执行时，LLM 看到的历史必须以用户消息结尾且角色交替
+        roles = [message['role'] for message in messages]
+        expected = ['user', 'assistant'] * (len(roles) // 2) + ['user'] * (len(roles) % 2)
+        if not roles or roles[-1] != 'user' or roles != expected:
+            llm_errors.append(roles)
+
+        # 随机延迟，让不同请求的执行交错
+        time.sleep(random.uniform(0.005, 0.03))
+        content = f"<final_answer>ECHO:{messages[-1]['content'] if messages else ''}</final_answer>"
+        data = json.dumps({
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        }).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_llm():
+    """启动模拟 LLM 服务，返回其地址"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1"
+
+
+def start_backend(llm_base, history_dir, asgi=False):
+    """在当前进程中启动 APOS 后端（多线程 WSGI 或 ASGI），返回 (API 地址, 停止服务的函数)"""
+    os.environ.update({
+        'OPENAI_API_KEY': 'stub-key',
+        'OPENAI_API_BASE': llm_base,
+        'OPENAI_API_MODEL': 'stub-model',
+        'HISTORY_DIR': history_dir,
+        'BLOB_DIR': os.path.join(history_dir, 'blobs'),
+        'MAX_HISTORY_LENGTH': str(MESSAGES_PER_SESSION * 2 + 10),
+        'LOG_LEVEL': 'WARNING'
+    })
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+    if asgi:
+        import socket
+        import uvicorn
+        from app import create_asgi_app
+
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        server = uvicorn.Server(uvicorn.Config(create_asgi_app(), log_level='warning'))
+        threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+
+        def stop():
+            server.should_exit = True
+        return f"http://127.0.0.1:{sock.getsockname()[1]}/api", stop
+
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app()
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/api", server.shutdown
+
+
+def send_chat(base_url, session_id, text):
+    """发送一条聊天消息"""
+    response = requests.post(f"{base_url}/chat", json={'message': text, 'session_id': session_id}, timeout=60)
+    data = response.json()
+    return response.status_code == 200 and data.get('status') == 'completed', data
+
+
+def check_history(session_id, history):
+    """检查单个会话的历史记录，返回发现的问题列表"""
+    problems = []
+    if len(history) != MESSAGES_PER_SESSION * 2:
+        problems.append(f"消息数量 {len(history)}，应为 {MESSAGES_PER_SESSION * 2}")
+
+    seqs = [message['seq'] for message in history]
+    if seqs != sorted(set(seqs)):
+        problems.append(f"序号不是严格递增: {seqs}")
+
+    sent = set()
+    for index in range(0, len(history) - 1, 2):
+        user, assistant = history[index], history[index + 1]
+        if user['role'] != 'user' or assistant['role'] != 'assistant':
+            problems.append(f"第 {index} 条起角色顺序错误: {user['role']}, {assistant['role']}")
+            break
+        if assistant['content'] != f"<final_answer>ECHO:{user['content']}</final_answer>":
+            problems.append(f"第 {index + 1} 条回复与用户消息不对应")
+        sent.add(user['content'])
+
+    missing = {f"{session_id}#{i}" for i in range(MESSAGES_PER_SESSION)} - sent
+    if missing:
+        problems.append(f"丢失消息: {sorted(missing)}")
+    return problems
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始 APOS 并发压力测试")
+    print("=" * 50)
+
+    history_dir = tempfile.mkdtemp(prefix='apos-concurrency-')
+    llm_base = start_stub_llm()
+    base_url, stop_server = start_backend(llm_base, history_dir, asgi='--asgi' in sys.argv)
+    print(f"📡 模拟 LLM: {llm_base}")
+    print(f"📡 后端地址: {base_url}")
+    print(f"📁 会话目录: {history_dir}")
+
+    session_ids = [f"stress-{i}" for i in range(SESSION_COUNT)]
+    jobs = [(session_id, f"{session_id}#{i}") for i in range(MESSAGES_PER_SESSION) for session_id in session_ids]
+    random.shuffle(jobs)
+
+    print(f"\n💬 并发发送 {len(jobs)} 条消息到 {SESSION_COUNT} 个会话（{WORKERS} 个并发）...")
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        results = list(executor.map(lambda job: send_chat(base_url, *job), jobs))
+    elapsed = time.time() - started
+    failed = [data for ok, data in results if not ok]
+    print(f"⏱️ 耗时 {elapsed:.2f} 秒，失败请求 {len(failed)} 个")
+    for data in failed[:5]:
+        print(f"  ❌ {data}")
+
+    print("\n📚 检查历史记录...")
+    problems = {}
+    for session_id in session_ids:
+        history = requests.get(f"{base_url}/history/{session_id}", timeout=30).json()['history']
+        session_problems = check_history(session_id, history)
+        if session_problems:
+            problems[session_id] = session_problems
+    for session_id, session_problems in problems.items():
+        for problem in session_problems[:3]:
+            print(f"  ❌ {session_id}: {problem}")
+
+    print("\n💾 检查持久化结果...")
+    from core.api import agent
+    from core.history_manager import HistoryManager
+    agent.history_manager.writer.flush()
+    reloaded = HistoryManager()
+    persisted_mismatch = [
+        session_id for session_id in session_ids
+        if reloaded.get_history(session_id) != agent.history_manager.get_history(session_id)
+    ]
+    stop_server()
+
+    print("\n" + "=" * 50)
+    print("📊 测试结果汇总:")
+    checks = [
+        ("请求全部成功", not failed),
+        ("历史记录一致", not problems),
+        ("LLM 收到的历史有序", not llm_errors),
+        ("磁盘数据与内存一致", not persisted_mismatch),
+    ]
+    passed = 0
+    for check_name, result in checks:
+        status = "✅ 通过" if result else "❌ 失败"
+        print(f"  {check_name}: {status}")
+        if result:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(checks)} 项检查通过")
+    if passed == len(checks):
+        print("🎉 并发请求下会话历史保持一致")
+    else:
+        print("⚠️ 检测到并发问题，请检查会话锁")
+    return 0 if passed == len(checks) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())